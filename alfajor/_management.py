@@ -28,6 +28,7 @@ managers = {
         'wsgi': 'alfajor.browsers.managers:WSGIManager',
         'network': 'alfajor.browsers.managers:NetworkManager',
         'zero': 'alfajor.browsers.managers:ZeroManager',
+        'replay': 'alfajor.browsers.managers:ReplayManager',
         },
     'apiclient': {
         'wsgi': 'alfajor.apiclient:WSGIClientManager',
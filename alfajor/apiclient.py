@@ -18,8 +18,9 @@ from wsgiref.util import request_uri
 from werkzeug import BaseResponse, Headers, create_environ, run_wsgi_app
 from werkzeug.test import _TestCookieJar, encode_multipart
 
+from alfajor.recording import request_body
 from alfajor.utilities import eval_dotted_path
-from alfajor._compat import json_loads as loads
+from alfajor._compat import json_loads as loads, property
 
 
 logger = getLogger(__name__)
@@ -38,6 +39,7 @@ class WSGIClientManager(object):
 
     def __init__(self, frontend_name, backend_config, runner_options):
         self.config = backend_config
+        self.client = None
 
     def create(self):
         from alfajor.apiclient import APIClient
@@ -46,20 +48,60 @@ class WSGIClientManager(object):
         app = eval_dotted_path(entry_point)
 
         base_url = self.config.get('base_url')
+        recorder = None
+        if self.config.get('record'):
+            from alfajor.recording import Recorder
+            recorder = Recorder(self.config['record'])
         logger.debug("Created in-process WSGI api client rooted at %s.",
                      base_url)
-        return APIClient(app, base_url=base_url)
+        self.client = APIClient(app, base_url=base_url, recorder=recorder)
+        return self.client
 
     def destroy(self):
         logger.debug("Destroying in-process WSGI api client.")
+        if self.client is not None and self.client.recorder is not None:
+            self.client.recorder.close()
+            self.client.recorder = None
+        self.client = None
 
 
 class APIClient(object):
 
-    def __init__(self, application, state=None, base_url=None):
+    def __init__(self, application, state=None, base_url=None, profiler=None,
+                 recorder=None):
         self.application = application
         self.state = state or _APIClientState(application)
         self.base_url = base_url
+        if profiler is not None:
+            self.profiler = profiler
+        if recorder is not None:
+            self.recorder = recorder
+
+    @property
+    def profiler(self):
+        """An optional :class:`~alfajor.utilities.RequestProfiler`.
+
+        Clients born from responses share their parent's profiler.
+
+        """
+        return self.state.profiler
+
+    @profiler.setter
+    def profiler(self, profiler):
+        self.state.profiler = profiler
+
+    @property
+    def recorder(self):
+        """An optional :class:`~alfajor.recording.Recorder`.
+
+        Clients born from responses share their parent's recorder.
+
+        """
+        return self.state.recorder
+
+    @recorder.setter
+    def recorder(self, recorder):
+        self.state.recorder = recorder
 
     def open(self, path='/', base_url=None, query_string=None, method='GET',
              data=None, input_stream=None, content_type=None,
@@ -94,10 +136,24 @@ class APIClient(object):
         if environ_overrides:
             environ.update(environ_overrides)
 
-        logger.info("%s %s" % (method, request_uri(environ)))
-        rv = run_wsgi_app(self.application, environ, buffered=buffered)
+        uri = request_uri(environ)
+        logger.info("%s %s" % (method, uri))
+        recorder = current_state.recorder
+        if recorder is not None:
+            sent_body = request_body(environ)
+        profiler = current_state.profiler
+        if profiler is not None and profiler.wants(uri):
+            # buffer so the profile includes generating the body
+            rv = profiler.call(uri, run_wsgi_app, self.application, environ,
+                               buffered=True)
+        else:
+            rv = run_wsgi_app(self.application, environ, buffered=buffered)
 
         response = _APIClientResponse(*rv)
+        if recorder is not None:
+            recorder.record(method, uri, sent_body,
+                            environ.get('CONTENT_TYPE'), response.status,
+                            response.headers, response.response)
         response.state = new_state = current_state.copy()
         new_state.process_response(response, environ)
         return response
@@ -231,6 +287,8 @@ class _APIClientResponse(object):
 
 class _APIClientState(object):
     default_base_url = 'http://localhost'
+    profiler = None
+    recorder = None
 
     def __init__(self, application):
         self.application = application
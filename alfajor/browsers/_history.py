@@ -0,0 +1,189 @@
+# Copyright Action Without Borders, Inc., the Alfajor authors and contributors.
+# All rights reserved.  See AUTHORS.
+#
+# This file is part of 'Alfajor' and is distributed under the BSD license.
+# See LICENSE for more details.
+
+"""A memory-bounded record of recently loaded pages."""
+
+from collections import deque
+import mmap
+import os
+import shutil
+import tempfile
+from time import time
+
+from alfajor.utilities import to_pairs
+
+
+__all__ = ['History', 'HistoryEntry']
+
+
+class HistoryEntry(object):
+    """One page load: request and response metadata plus the body."""
+
+    __slots__ = ('method', 'url', 'status_code', 'headers', 'time',
+                 'duration', 'size', '_body', '_path')
+
+    def __init__(self, method, url, status_code, headers, body, duration):
+        self.method = method
+        self.url = url
+        self.status_code = status_code
+        self.headers = tuple(to_pairs(headers or ()))
+        self.time = time()
+        self.duration = duration
+        self.size = len(body)
+        self._body = body
+        self._path = None
+
+    @property
+    def spilled(self):
+        """True if the body has been moved to disk."""
+        return self._path is not None
+
+    @property
+    def body(self):
+        """The response body, read back through mmap if spilled."""
+        if self._path is None:
+            return self._body
+        if not self.size:
+            return ''
+        fh = open(self._path, 'rb')
+        try:
+            mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                return mapped[:]
+            finally:
+                mapped.close()
+        finally:
+            fh.close()
+
+    def _spill(self, path):
+        fh = open(path, 'wb')
+        try:
+            fh.write(self._body)
+        finally:
+            fh.close()
+        self._path = path
+        self._body = None
+
+    def _discard(self):
+        if self._path is not None:
+            try:
+                os.remove(self._path)
+            except OSError:
+                pass
+            self._path = None
+        self._body = None
+
+    def __repr__(self):
+        return '<%s %s %s %s (%s bytes%s)>' % (
+            type(self).__name__, self.method, self.url, self.status_code,
+            self.size, self.spilled and ', spilled' or '')
+
+
+class History(object):
+    """The last *size* page loads of a browser, oldest first.
+
+    Bodies are kept in memory up to *memory_budget* bytes in total; beyond
+    that the oldest bodies are written to files in a temporary directory
+    and read back with mmap on access.  Evicted entries are deleted from
+    disk.
+
+    """
+
+    def __init__(self, size=20, memory_budget=1024 * 1024):
+        self.size = int(size)
+        self.memory_budget = int(memory_budget)
+        self.entries = deque()
+        self._in_memory = 0
+        self._directory = None
+        self._counter = 0
+
+    def record(self, method, url, status_code, headers, body, duration=None):
+        """Add a page load, evicting and spilling older entries as needed."""
+        if body is None:
+            body = ''
+        elif isinstance(body, unicode):
+            body = body.encode('utf-8')
+        entry = HistoryEntry(method, url, status_code, headers, body,
+                             duration)
+        self.entries.append(entry)
+        self._in_memory += entry.size
+        while len(self.entries) > self.size:
+            self._evict(self.entries.popleft())
+        if self._in_memory > self.memory_budget:
+            for old in self.entries:
+                if self._in_memory <= self.memory_budget:
+                    break
+                if not old.spilled:
+                    self._counter += 1
+                    old._spill(os.path.join(self._spill_directory(),
+                                            '%06d.body' % self._counter))
+                    self._in_memory -= old.size
+        return entry
+
+    def dump(self, directory, prefix='page'):
+        """Write each entry's body and headers to *directory*.
+
+        Returns the paths of the written body files, oldest first.
+
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        paths = []
+        for n, entry in enumerate(self.entries):
+            path = os.path.join(directory, '%s-%02d.html' % (prefix, n))
+            fh = open(path, 'wb')
+            try:
+                fh.write(entry.body)
+            finally:
+                fh.close()
+            fh = open(path[:-len('.html')] + '.headers', 'w')
+            try:
+                fh.write('%s %s\n%s\n\n' % (entry.method, entry.url,
+                                            entry.status_code))
+                for key, value in entry.headers:
+                    fh.write('%s: %s\n' % (key, value))
+            finally:
+                fh.close()
+            paths.append(path)
+        return paths
+
+    def clear(self):
+        """Forget all entries and remove spilled bodies."""
+        while self.entries:
+            self._evict(self.entries.popleft())
+        if self._directory is not None:
+            shutil.rmtree(self._directory, True)
+            self._directory = None
+
+    def _evict(self, entry):
+        if not entry.spilled:
+            self._in_memory -= entry.size
+        entry._discard()
+
+    def _spill_directory(self):
+        if self._directory is None:
+            self._directory = tempfile.mkdtemp(prefix='alfajor-history-')
+        return self._directory
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, index):
+        return self.entries[index]
+
+    def __del__(self):
+        try:
+            self.clear()
+        except Exception:
+            pass
+
+    def __repr__(self):
+        return '<%s %s/%s entries, %s bytes in memory>' % (
+            type(self).__name__, len(self.entries), self.size,
+            self._in_memory)
@@ -0,0 +1,214 @@
+# Copyright Action Without Borders, Inc., the Alfajor authors and contributors.
+# All rights reserved.  See AUTHORS.
+#
+# This file is part of 'Alfajor' and is distributed under the BSD license.
+# See LICENSE for more details.
+
+"""A small client-side HTTP cache for GET responses."""
+
+from calendar import timegm
+import re
+from time import time
+
+from werkzeug.http import parse_cache_control_header, parse_date
+
+
+__all__ = ['CacheEntry', 'HTTPCache']
+
+
+class CacheEntry(object):
+    """A cached response and what is known about its freshness."""
+
+    __slots__ = ('url', 'status', 'headers', 'body', 'stored', 'max_age',
+                 'document')
+
+    def __init__(self, url, status, headers, body):
+        self.url = url
+        self.status = status
+        self.headers = list(headers)
+        self.body = body
+        #: A parsed document of :attr:`body`, if a browser stored one.
+        self.document = None
+        self._update(self.headers)
+
+    @property
+    def fresh(self):
+        """True if the entry may be used without revalidation."""
+        return time() - self.stored < self.max_age
+
+    @property
+    def etag(self):
+        return self._header('ETag')
+
+    @property
+    def last_modified(self):
+        return self._header('Last-Modified')
+
+    def validators(self):
+        """Conditional request headers for revalidating this entry."""
+        validators = []
+        if self.etag is not None:
+            validators.append(('If-None-Match', self.etag))
+        if self.last_modified is not None:
+            validators.append(('If-Modified-Since', self.last_modified))
+        return validators
+
+    def revalidated(self, headers):
+        """Merge the headers of a 304 response and restart freshness."""
+        updates = dict((key.lower(), (key, value))
+                       for key, value in headers
+                       if key.lower() in _updated_headers)
+        merged = []
+        for key, value in self.headers:
+            if key.lower() in updates:
+                merged.append(updates.pop(key.lower()))
+            else:
+                merged.append((key, value))
+        merged.extend(updates.values())
+        self.headers = merged
+        self._update(merged)
+
+    def _update(self, headers):
+        self.stored = time()
+        self.max_age = _max_age(headers)
+
+    def _header(self, name):
+        name = name.lower()
+        for key, value in self.headers:
+            if key.lower() == name:
+                return value
+        return None
+
+    def __repr__(self):
+        return '<%s %s %s%s>' % (type(self).__name__, self.url, self.status,
+                                 self.fresh and ' fresh' or '')
+
+
+class HTTPCache(object):
+    """A bounded, private cache of GET responses.
+
+    Only URLs matching one of the regular expressions in *patterns* are
+    cached.  Responses are stored if they are ``200 OK``, set no cookies,
+    have no ``Vary`` header and are not marked ``no-store``.  An entry is
+    used as is while ``Cache-Control: max-age`` (or ``Expires``) says it is
+    fresh, and is otherwise revalidated with its ``ETag`` and
+    ``Last-Modified`` validators.  The least recently used entry is
+    discarded when more than *size* are held.
+
+    """
+
+    def __init__(self, patterns=(), size=128):
+        if isinstance(patterns, basestring):
+            patterns = patterns.split()
+        self.patterns = [re.compile(pattern) for pattern in patterns]
+        self.size = int(size)
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+        self._entries = {}
+        self._order = []
+
+    def allows(self, url):
+        """True if responses for *url* may be cached."""
+        for pattern in self.patterns:
+            if pattern.search(url):
+                return True
+        return False
+
+    def lookup(self, url):
+        """Return the :class:`CacheEntry` for *url*, or None.
+
+        Entries that are no longer :attr:`~CacheEntry.fresh` are returned
+        for revalidation.
+
+        """
+        try:
+            entry = self._entries[url]
+        except KeyError:
+            self.misses += 1
+            return None
+        if entry.fresh:
+            self.hits += 1
+        else:
+            self.revalidations += 1
+        self._order.remove(url)
+        self._order.append(url)
+        return entry
+
+    def store(self, url, status_code, status, headers, body):
+        """Cache a response if it is cacheable; returns the entry or None."""
+        if status_code != 200 or not _storable(headers):
+            self.discard(url)
+            return None
+        entry = CacheEntry(url, status, headers, body)
+        if (entry.max_age <= 0 and entry.etag is None and
+            entry.last_modified is None):
+            # could never be used without fetching it again
+            self.discard(url)
+            return None
+        self.discard(url)
+        while len(self._order) >= self.size:
+            del self._entries[self._order.pop(0)]
+        self._entries[url] = entry
+        self._order.append(url)
+        return entry
+
+    def discard(self, url):
+        if url in self._entries:
+            del self._entries[url]
+            self._order.remove(url)
+
+    def clear(self):
+        """Discard all cached responses."""
+        self._entries.clear()
+        del self._order[:]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return '<%s %s/%s hits=%s revalidations=%s misses=%s>' % (
+            type(self).__name__, len(self), self.size, self.hits,
+            self.revalidations, self.misses)
+
+
+_updated_headers = set(['cache-control', 'date', 'etag', 'expires',
+                        'last-modified'])
+
+
+def _storable(headers):
+    for key, value in headers:
+        key = key.lower()
+        if key in ('set-cookie', 'set-cookie2', 'vary'):
+            return False
+        if key == 'cache-control' and parse_cache_control_header(
+            value).no_store:
+            return False
+    return True
+
+
+def _max_age(headers):
+    """Seconds a response with *headers* stays fresh."""
+    cache_control = expires = date = None
+    for key, value in headers:
+        key = key.lower()
+        if key == 'cache-control':
+            cache_control = parse_cache_control_header(value)
+        elif key == 'expires':
+            expires = parse_date(value)
+        elif key == 'date':
+            date = parse_date(value)
+    if cache_control is not None:
+        if cache_control.no_cache:
+            return 0
+        if cache_control.max_age is not None:
+            try:
+                return int(cache_control.max_age)
+            except ValueError:
+                return 0
+    if expires is not None:
+        if date is not None:
+            return timegm(expires.utctimetuple()) - timegm(
+                date.utctimetuple())
+        return timegm(expires.utctimetuple()) - time()
+    return 0
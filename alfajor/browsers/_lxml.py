@@ -7,10 +7,13 @@
 
 """Low level LXML element implementation & parser wrangling."""
 from collections import defaultdict
+import copy
+from hashlib import sha1
 import mimetypes
 import re
 from UserDict import DictMixin
 from textwrap import fill
+from time import time
 
 from lxml import html as lxml_html
 from lxml.etree import ElementTree, XPath
@@ -20,11 +23,12 @@ from lxml.html import (
     )
 from lxml.html._setmixin import SetMixin
 
+from alfajor.browsers._timing import BrowserStats, Timing
 from alfajor._compat import property
 from alfajor.utilities import lazy_property, to_pairs
 
 
-__all__ = ['html_parser_for', 'html_from_string']
+__all__ = ['DocumentCache', 'html_parser_for', 'html_from_string']
 _single_id_selector = re.compile(r'#[A-Za-z][A-Za-z0-9:_.\-]*$')
 XHTML_NAMESPACE = "http://www.w3.org/1999/xhtml"
 
@@ -35,6 +39,9 @@ _options_xpath = XPath(
 _collect_string_content = XPath("string()")
 _forms_xpath = XPath("descendant-or-self::form|descendant-or-self::x:form",
                      namespaces={'x': XHTML_NAMESPACE})
+_inputs_xpath = XPath(".//*[local-name() = 'select' or "
+                      "local-name() = 'input' or "
+                      "local-name() = 'textarea']")
 
 
 def _nons(tag):
@@ -74,8 +81,28 @@ class DOMMixin(object):
       def _lxml_parser(self):
           return html_parser_for(self, self.element_mixins)
 
+    Browsers may also be given a :class:`DocumentCache` as
+    ``self.document_cache`` to avoid re-parsing identical responses.
+
+    Operations are timed: :attr:`timing` holds the :class:`Timing` of the
+    operation in progress or last completed (and so is available to
+    ``after_browser_activity`` receivers as ``sender.timing``) and
+    :attr:`stats` accumulates them.
+
     """
 
+    document_cache = None
+
+    #: An optional :class:`~alfajor.browsers._history.History` of page loads.
+    history = None
+
+    timing = None
+
+    @lazy_property
+    def stats(self):
+        """A :class:`BrowserStats` of all timed operations."""
+        return BrowserStats()
+
     @lazy_property
     def document(self):
         """An LXML tree of the :attr:`response` content."""
@@ -83,11 +110,54 @@ class DOMMixin(object):
         # be what the remote sent, may not.)
         if self.response is None:
             return None
-        return html_from_string(self.response, parser=self._lxml_parser)
+        started = time()
+        if self.document_cache is not None:
+            document = self.document_cache.lookup(self.response,
+                                                  self._parse_response)
+        else:
+            document = self._parse_response(self.response)
+        self._add_timing('parse', time() - started)
+        return document
+
+    def _parse_response(self, response):
+        return html_from_string(response, parser=self._lxml_parser)
+
+    def _begin_timing(self, operation, url=None):
+        """Start timing *operation*; returns its :class:`Timing`."""
+        self.timing = timing = Timing(operation, url)
+        return timing
+
+    def _end_timing(self, timing):
+        """Finish *timing* and add it to :attr:`stats`."""
+        timing.finish()
+        self.stats.record(timing)
+
+    def _add_timing(self, phase, seconds):
+        """Charge *seconds* of *phase* to the running operation, if any."""
+        timing = self.timing
+        if timing is not None and not timing.finished:
+            timing.add(phase, seconds)
+        else:
+            self.stats.add(phase, seconds)
+
+    def _record_history(self, method, url):
+        """Add the current page to :attr:`history`, if enabled."""
+        timing = self.timing
+        self.history.record(method, url, self.status_code, self.headers,
+                            self.response, timing and timing.duration)
+
+    @lazy_property
+    def _document_index(self):
+        """Paths, ids and names of every element in :attr:`document`."""
+        document = self.document
+        if document is None:
+            return None
+        return _DocumentIndex(document)
 
     def sync_document(self):
         """Synchronize the :attr:`document` DOM with the visible page."""
         self.__dict__.pop('document', None)
+        self.__dict__.pop('_document_index', None)
 
     def __contains__(self, needle):
         """True if *needle* exists anywhere in the response content."""
@@ -110,6 +180,124 @@ class DOMMixin(object):
         """A CSS selector function selecting at the top of the document."""
         return self.document.cssselect
 
+    def visible(self, elements):
+        """Return a list of the :attr:`is_visible` flags of *elements*.
+
+        Browsers that must ask a remote page for visibility answer for all
+        elements at once.
+
+        """
+        return [element.is_visible for element in elements]
+
+
+class DocumentCache(object):
+    """A bounded cache of parsed documents keyed by response content.
+
+    Each distinct response body is parsed once; later byte-identical
+    responses receive a copy of the cached tree, so changes made to one
+    document (e.g. filling in a form) never show up in another.  The least
+    recently used document is discarded when more than *size* are held.
+
+    A cache holds documents built by one browser's parser and must not be
+    shared between browsers.
+
+    """
+
+    def __init__(self, size=32):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._documents = {}
+        self._order = []
+
+    def lookup(self, response, parse):
+        """Return a document for *response*, calling *parse* on a miss."""
+        if isinstance(response, unicode):
+            key = sha1(response.encode('utf-8')).digest()
+        else:
+            key = sha1(response).digest()
+        try:
+            cached = self._documents[key]
+        except KeyError:
+            self.misses += 1
+            document = parse(response)
+            self._store(key, copy.deepcopy(document))
+            return document
+        self.hits += 1
+        self._order.remove(key)
+        self._order.append(key)
+        return copy.deepcopy(cached)
+
+    def clear(self):
+        """Discard all cached documents."""
+        self._documents.clear()
+        del self._order[:]
+
+    def __len__(self):
+        return len(self._documents)
+
+    def __repr__(self):
+        return '<%s %s/%s hits=%s misses=%s>' % (
+            type(self).__name__, len(self), self.size, self.hits,
+            self.misses)
+
+    def _store(self, key, document):
+        if self.size <= 0:
+            return
+        while len(self._order) >= self.size:
+            del self._documents[self._order.pop(0)]
+        self._documents[key] = document
+        self._order.append(key)
+
+
+class _DocumentIndex(object):
+    """Absolute XPaths and id/name tallies for all elements of a document.
+
+    Built in a single walk of the tree, which is much cheaper than asking
+    lxml for the path of many elements one at a time.  Elements are held as
+    keys, which keeps their proxies (and so their identities) alive for the
+    life of the index.
+
+    """
+
+    def __init__(self, document):
+        self.paths = {}
+        self.ids = {}
+        self.names = {}
+        tree = document.getroottree()
+        root = tree.getroot()
+        self._add(root, tree.getpath(root))
+        stack = [root]
+        while stack:
+            parent = stack.pop()
+            parent_path = self.paths[parent]
+            children = [child for child in parent.iterchildren()
+                        if isinstance(child.tag, basestring)]
+            counts = {}
+            for child in children:
+                counts[child.tag] = counts.get(child.tag, 0) + 1
+            positions = {}
+            for child in children:
+                tag = child.tag
+                if tag[0] == '{':
+                    path = tree.getpath(child)
+                elif counts[tag] > 1:
+                    positions[tag] = position = positions.get(tag, 0) + 1
+                    path = '%s/%s[%s]' % (parent_path, tag, position)
+                else:
+                    path = '%s/%s' % (parent_path, tag)
+                self._add(child, path)
+                stack.append(child)
+
+    def _add(self, element, path):
+        self.paths[element] = path
+        id = element.get('id')
+        if id:
+            self.ids[id] = self.ids.get(id, 0) + 1
+        name = element.get('name')
+        if name:
+            self.names[name] = self.names.get(name, 0) + 1
+
 
 class DOMElement(object):
     """Functionality added to all elements on all browsers."""
@@ -117,8 +305,27 @@ class DOMElement(object):
     @lazy_property
     def fq_xpath(self):
         """The fully qualified xpath to this element."""
+        index = self._document_index
+        if index is not None:
+            try:
+                return index.paths[self]
+            except KeyError:
+                pass
         return ElementTree(self).getpath(self)
 
+    @property
+    def _document_index(self):
+        """The browser's index of the current document, if already parsed.
+
+        Elements of other trees (e.g. a document since replaced) are not
+        present in the index.
+
+        """
+        browser = self.browser
+        if browser.__dict__.get('document') is None:
+            return None
+        return browser._document_index
+
     @property
     def forms(self):
         """Return a list of all the forms."""
@@ -245,7 +452,11 @@ class FormElement(object):
         return InputGetter(self)
 
     def fields(self):
-        """A dict-like read/write mapping of form field values."""
+        """A dict-like read/write mapping of form field values.
+
+        Each access returns a new mapping indexed from the current state of
+        the form.
+        """
         return FieldsDict(self.inputs)
 
     fields = property(fields, lxml_html.FormElement._fields__set)
@@ -281,44 +492,51 @@ class FormElement(object):
             fields[name] = value
 
     def form_values(self):
-        """Return name, value pairs of form data as a browser would submit."""
+        """Return name, value pairs of form data as a browser would submit.
+
+        Controls are visited once each, in document order.
+
+        """
         results = []
-        for name, elements in self.inputs.iteritems():
+        for el in _inputs_xpath(self):
+            name = el.name
             if not name:
                 continue
-            if elements[0].tag == 'input':
-                type = elements[0].type
+            if el.tag == 'input':
+                type = el.type
             else:
-                type = elements[0].tag
+                type = el.tag
             if type in ('submit', 'image', 'reset'):
                 continue
-            for el in elements:
-                value = el.value
-                if getattr(el, 'checkable', False):
-                    if not el.checked:
-                        continue
+            if getattr(el, 'checkable', False):
+                if el.checked:
                     # emulate browser behavior for valueless checkboxes
-                    results.append((name, value or 'on'))
-                    continue
-                elif type == 'select':
-                    if value is None:
-                        # this won't be reached unless the first option is
-                        # <option/>
-                        options = el.cssselect('> option')
-                        if options:
-                            results.append((name, u''))
-                        continue
-                    elif el.multiple:
-                        for v in value:
-                            results.append((name, v))
-                        continue
-                elif type == 'file':
-                    if value:
-                        mimetype = mimetypes.guess_type(value)[0] \
-                                or 'application/octet-stream'
-                        results.append((name, (value, mimetype)))
-                        continue
-                results.append((name, value or u''))
+                    results.append((name, el.value or 'on'))
+            elif type == 'select':
+                options = _options_xpath(el)
+                selected = [_value_from_option(option) for option in options
+                            if option.get('selected') is not None]
+                if not selected:
+                    # an unselected single select submits an empty value,
+                    # but only if it has options at all; an unselected
+                    # multiple select submits nothing
+                    if options and not el.multiple:
+                        results.append((name, u''))
+                elif el.multiple:
+                    for value in selected:
+                        results.append((name, value))
+                else:
+                    results.append((name, selected[0] or u''))
+            elif type == 'file':
+                value = el.value
+                if value:
+                    mimetype = mimetypes.guess_type(value)[0] \
+                            or 'application/octet-stream'
+                    results.append((name, (value, mimetype)))
+                else:
+                    results.append((name, u''))
+            else:
+                results.append((name, el.value or u''))
         return results
 
     def __str__(self):
@@ -355,6 +573,19 @@ def _value_from_option(option):
     return opt_value
 
 
+def _option_index(select):
+    """Return *select*'s options and a mapping of value to first option.
+
+    Options are found and their values computed in a single pass.
+
+    """
+    options = _options_xpath(select)
+    by_value = {}
+    for option in options:
+        by_value.setdefault(_value_from_option(option), option)
+    return options, by_value
+
+
 # More or less from
 class MultipleSelectOptions(SetMixin):
     """
@@ -362,16 +593,23 @@ class MultipleSelectOptions(SetMixin):
 
     You can add to this set-like option to select an option, or remove
     to unselect the option.
+
+    Options are indexed by value on first use, so adding or removing many
+    values costs a single pass over the options.
     """
 
     def __init__(self, select):
         self.select = select
 
+    @lazy_property
+    def _index(self):
+        return _option_index(self.select)
+
     def options(self):
         """
         Iterator of all the ``<option>`` elements.
         """
-        return iter(_options_xpath(self.select))
+        return iter(self._index[0])
     options = property(options)
 
     def __iter__(self):
@@ -380,28 +618,28 @@ class MultipleSelectOptions(SetMixin):
                 yield _value_from_option(option)
 
     def add(self, item):
-        for option in self.options:
-            opt_value = _value_from_option(option)
-            if opt_value == item:
-                option.set('selected', '')
-                break
-        else:
+        try:
+            option = self._index[1][item]
+        except KeyError:
             raise ValueError(
                 "There is no option with the value %r" % item)
+        option.set('selected', '')
 
     def remove(self, item):
-        for option in self.options:
-            opt_value = _value_from_option(option)
-            if opt_value == item:
-                if 'selected' in option.attrib:
-                    del option.attrib['selected']
-                else:
-                    raise ValueError(
-                        "The option %r is not currently selected" % item)
-                break
-        else:
+        try:
+            option = self._index[1][item]
+        except KeyError:
             raise ValueError(
                 "There is not option with the value %r" % item)
+        if 'selected' in option.attrib:
+            del option.attrib['selected']
+        else:
+            raise ValueError(
+                "The option %r is not currently selected" % item)
+
+    def clear(self):
+        for option in self.options:
+            option.attrib.pop('selected', None)
 
     def __repr__(self):
         return '<%s {%s} for select name=%r>' % (
@@ -443,20 +681,19 @@ class SelectElement(_InputControl):
             if isinstance(value, basestring):
                 raise TypeError(
                     "You must pass in a sequence")
-            self.value.clear()
-            self.value.update(value)
+            selected = MultipleSelectOptions(self)
+            selected.clear()
+            selected.update(value)
             return
+        options, by_value = _option_index(self)
         if value is not None:
             value = value.strip()
-            for el in _options_xpath(self):
-                opt_value = _value_from_option(el)
-                if opt_value == value:
-                    checked_option = el
-                    break
-            else:
+            try:
+                checked_option = by_value[value]
+            except KeyError:
                 raise ValueError(
                     "There is no option with the value of %r" % value)
-        for el in _options_xpath(self):
+        for el in options:
             if 'selected' in el.attrib:
                 del el.attrib['selected']
         if value is not None:
@@ -540,11 +777,8 @@ class InputElement(_InputControl):
             # You can't un-check a radio button in any browser I know of
             if have and not value:
                 return
-            for el in self.form.inputs[self.name]:
-                if el.value == self.value:
-                    el.set('checked', '')
-                else:
-                    el.attrib.pop('checked', None)
+            _check_radio(self.form.inputs[self.name],
+                         self.get('value', 'on'))
             return
         if value:
             self.set('checked', '')
@@ -628,22 +862,53 @@ class InputGetter(lxml_html.InputGetter):
     This differs from the lxml behavior of this object, which comingles scalar
     and sequence results based on the form element type.
 
+    Names are indexed in a single pass over the form the first time the
+    getter is used, and the index reflects the form's controls at that
+    moment.  Access ``form.inputs`` again to see controls added, removed or
+    renamed since.
+
     """
 
+    @lazy_property
+    def _index(self):
+        """A mapping of control name to elements, plus names in doc order."""
+        index, names = {}, []
+        for el in _inputs_xpath(self.form):
+            name = el.name
+            if name is None:
+                continue
+            if name not in index:
+                index[name] = []
+                names.append(name)
+            index[name].append(el)
+        return index, names
+
     def __getitem__(self, name):
-        results = self._name_xpath(self.form, name=name)
-        if not results:
+        try:
+            return list(self._index[0][name])
+        except KeyError:
             raise KeyError("No input element with the name %r" % name)
-        return results
         # TODO:             group = RadioGroup(results)
 
+    def __contains__(self, name):
+        return name in self._index[0]
+
+    def keys(self):
+        return list(self._index[1])
+
     def iteritems(self):
-        for name in self.keys():
-            yield (name, self[name])
+        index, names = self._index
+        for name in names:
+            yield (name, list(index[name]))
 
 
 class FieldsDict(DictMixin):
-    """Reflects the current state of a form as a browser sees it."""
+    """Reflects the current state of a form as a browser sees it.
+
+    Lookups go through the name index of the :class:`InputGetter` the dict
+    was created with, so filling many fields costs one pass over the form.
+
+    """
 
     # Modeled after lxml_html.FieldsDict
 
@@ -698,7 +963,17 @@ class FieldsDict(DictMixin):
         first = elements[0]
         checkable = getattr(first, 'checkable', False)
 
-        if len(elements) == 1:
+        if (checkable and first.type == 'radio' and
+            isinstance(value, basestring) and value):
+            # toggle the indexed group directly rather than have each
+            # radio look its group up in the form again
+            for el in elements:
+                if el.get('value', 'on') == value:
+                    break
+            else:
+                raise KeyError("No radio button with value %r" % value)
+            _check_radio(elements, value)
+        elif len(elements) == 1:
             if not checkable:
                 first.value = value
             # checkbox dance
@@ -729,6 +1004,15 @@ class FieldsDict(DictMixin):
         return name in self.inputs
 
 
+def _check_radio(group, value):
+    """Check the radio buttons in *group* with *value*, uncheck the rest."""
+    for el in group:
+        if el.get('value', 'on') == value:
+            el.set('checked', '')
+        else:
+            el.attrib.pop('checked', None)
+
+
 def _group_key_value_pairs(values, with_prefix=''):
     """Transform *values* into a sequence of ('name', ['values']) pairs.
 
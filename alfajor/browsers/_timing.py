@@ -0,0 +1,135 @@
+# Copyright Action Without Borders, Inc., the Alfajor authors and contributors.
+# All rights reserved.  See AUTHORS.
+#
+# This file is part of 'Alfajor' and is distributed under the BSD license.
+# See LICENSE for more details.
+
+"""Timing records for browser operations."""
+
+from time import time
+
+
+__all__ = ['BrowserStats', 'Timing']
+
+
+class Timing(object):
+    """How long the phases of one browser operation took.
+
+    :attr:`phases` maps phase names (e.g. ``'app'``, ``'parse'``, ``'rc'``)
+    to seconds spent, and :attr:`counts` maps phase and event names (e.g.
+    ``'redirects'``) to the number of times they occurred.
+
+    """
+
+    __slots__ = ('operation', 'url', 'started', 'ended', 'phases', 'counts')
+
+    def __init__(self, operation, url=None):
+        self.operation = operation
+        self.url = url
+        self.started = time()
+        self.ended = None
+        self.phases = {}
+        self.counts = {}
+
+    @property
+    def finished(self):
+        """True once the operation has completed."""
+        return self.ended is not None
+
+    @property
+    def duration(self):
+        """Seconds from start to finish (or to now, if still running)."""
+        return (self.ended or time()) - self.started
+
+    def add(self, phase, seconds):
+        """Add *seconds* spent in *phase*."""
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+        self.count(phase)
+
+    def count(self, event, n=1):
+        """Count *n* occurrences of *event*."""
+        self.counts[event] = self.counts.get(event, 0) + n
+
+    def finish(self):
+        self.ended = time()
+
+    def as_dict(self):
+        return {
+            'operation': self.operation,
+            'url': self.url,
+            'started': self.started,
+            'duration': self.duration,
+            'phases': dict(self.phases),
+            'counts': dict(self.counts),
+            }
+
+    def __repr__(self):
+        phases = ', '.join('%s=%0.4f' % item
+                           for item in sorted(self.phases.items()))
+        return '<%s %s %s %0.4fsec (%s)>' % (
+            type(self).__name__, self.operation, self.url or '',
+            self.duration, phases)
+
+
+class BrowserStats(object):
+    """Running totals of a browser's operation timings.
+
+    :attr:`operations` and :attr:`phases` map names to ``[count, seconds]``
+    pairs; :attr:`counts` maps event names to totals.  Phases that happen
+    outside of an operation (e.g. parsing a document on first access) are
+    totalled in :attr:`phases` as well.
+
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Discard all totals."""
+        self.operations = {}
+        self.phases = {}
+        self.counts = {}
+
+    def record(self, timing):
+        """Add a finished :class:`Timing` to the totals."""
+        _tally(self.operations, timing.operation, 1, timing.duration)
+        for phase, seconds in timing.phases.iteritems():
+            _tally(self.phases, phase, 0, seconds)
+        for event, n in timing.counts.iteritems():
+            if event in timing.phases:
+                self.phases[event][0] += n
+            else:
+                self.counts[event] = self.counts.get(event, 0) + n
+
+    def add(self, phase, seconds):
+        """Add *seconds* spent in *phase* outside of any operation."""
+        _tally(self.phases, phase, 1, seconds)
+
+    def as_dict(self):
+        return {
+            'operations': dict((k, list(v))
+                               for k, v in self.operations.iteritems()),
+            'phases': dict((k, list(v)) for k, v in self.phases.iteritems()),
+            'counts': dict(self.counts),
+            }
+
+    def __str__(self):
+        lines = []
+        for label, totals in (('operation', self.operations),
+                              ('phase', self.phases)):
+            for name, (n, seconds) in sorted(totals.items(),
+                                             key=lambda item: -item[1][1]):
+                lines.append('%-9s %-20s %6d %9.4fsec' % (
+                    label, name, n, seconds))
+        for name, n in sorted(self.counts.items()):
+            lines.append('%-9s %-20s %6d' % ('count', name, n))
+        return '\n'.join(lines)
+
+
+def _tally(totals, key, n, seconds):
+    try:
+        entry = totals[key]
+    except KeyError:
+        entry = totals[key] = [0, 0.0]
+    entry[0] += n
+    entry[1] += seconds
@@ -6,7 +6,12 @@
 
 """Compound wait_for expression support."""
 
-__all__ = 'WaitExpression', 'SeleniumWaitExpression'
+import re
+
+from lxml.cssselect import CSSSelector
+from lxml.etree import XPath
+
+__all__ = 'LxmlWaitExpression', 'WaitExpression', 'SeleniumWaitExpression'
 
 OR = object()
 
@@ -87,30 +92,355 @@ class WaitExpression(object):
 
 
 class SeleniumWaitExpression(WaitExpression):
-    """Compound wait_for expression compiler for Selenium browsers."""
+    """Compound wait_for expression compiler for Selenium browsers.
+
+    The JavaScript for each component is rendered once per distinct
+    component (e.g. per ``element_present`` locator) and shared by all
+    expressions; the combined predicate is rendered once per expression.
+
+    """
 
     def __init__(self, *expressions):
         self._expressions = []
+        self._rendered = None
         WaitExpression.__init__(self, *expressions)
 
     def or_(self):
-        self._expressions.append(OR)
+        self._append(OR)
         return self
 
     def element_present(self, finder):
-        js = self._is_element_present('element_present', finder, 'true')
-        self._expressions.append(js)
+        locator = to_locator(finder)
+        self._append(_compiled(('element_present', locator),
+                               _element_present_js,
+                               'element_present', locator, 'true'))
         return self
 
     def element_not_present(self, finder):
-        js = self._is_element_present('element_not_present', finder, 'false')
-        self._expressions.append(js)
+        locator = to_locator(finder)
+        self._append(_compiled(('element_not_present', locator),
+                               _element_present_js,
+                               'element_not_present', locator, 'false'))
         return self
 
     def evaluate_element(self, finder, expr):
         locator = to_locator(finder)
-        log = evaluation_log('evaluate_element', 'result', locator, expr)
-        js = """\
+        self._append(_compiled(('evaluate_element', locator, expr),
+                               _evaluate_element_js, locator, expr))
+        return self
+
+    def ajax_pending(self):
+        self._append(_compiled(('ajax_pending',), _ajax_pending_js))
+        return self
+
+    def ajax_complete(self):
+        self._append(_compiled(('ajax_complete',), _ajax_complete_js))
+        return self
+
+    def _append(self, js):
+        self._expressions.append(js)
+        self._rendered = None
+
+    def __unicode__(self):
+        if self._rendered is not None:
+            return self._rendered
+        last = None
+        components = []
+        for expr in self._expressions:
+            if expr is OR:
+                components.append(u'||')
+            else:
+                if last not in (None, OR):
+                    components.append(u'&&')
+                components.append(expr)
+            last = expr
+        self._rendered = predicate = u' '.join(components)
+        return predicate
+
+
+class LxmlWaitExpression(WaitExpression):
+    """Compound wait_for expression evaluated in Python.
+
+    For browsers without JavaScript.  The expression is compiled into a
+    predicate over the browser's lxml document: each finder becomes a
+    cached, precompiled CSS selector or XPath, and the components are
+    combined into a short-circuiting and/or tree.  No ajax requests are
+    ever pending, and :meth:`evaluate_element` requires a Python callable
+    in place of JavaScript.
+
+    """
+
+    def __init__(self, *expressions):
+        self._expressions = []
+        self._compiled = None
+        WaitExpression.__init__(self, *expressions)
+
+    def or_(self):
+        self._append(OR)
+        return self
+
+    def element_present(self, finder):
+        self._append((_present, finder, True))
+        return self
+
+    def element_not_present(self, finder):
+        self._append((_present, finder, False))
+        return self
+
+    def evaluate_element(self, finder, expr):
+        """True if *finder* is present on the page and evaluated by *expr*.
+
+        :param finder: a CSS selector or document element instance
+
+        :param expr: a Python callable, called with the first element
+          matching *finder* and returning true or false.
+
+        """
+        if not callable(expr):
+            raise TypeError("evaluate_element requires a Python callable on "
+                            "browsers without JavaScript, got %r" % (expr,))
+        self._append((_evaluate, finder, expr))
+        return self
+
+    def ajax_pending(self):
+        self._append((_constant, None, False))
+        return self
+
+    def ajax_complete(self):
+        self._append((_constant, None, True))
+        return self
+
+    def _append(self, expr):
+        self._expressions.append(expr)
+        self._compiled = None
+
+    def compile(self):
+        """Return a callable testing this expression against a document.
+
+        The result is cached until the expression is extended.
+
+        """
+        if self._compiled is None:
+            # && binds tighter than ||, as in the JavaScript rendering.
+            groups = [[]]
+            for expr in self._expressions:
+                if expr is OR:
+                    groups.append([])
+                else:
+                    term, finder, arg = expr
+                    if finder is not None:
+                        finder = _compile_finder(finder)
+                    groups[-1].append(term(finder, arg))
+            self._compiled = _any_of_all(groups)
+        return self._compiled
+
+    def evaluate(self, document):
+        """True if the expression holds for the lxml *document*."""
+        return self.compile()(document)
+
+    def __repr__(self):
+        return '<%s %r>' % (type(self).__name__, self._expressions)
+
+
+def lxml_predicate(condition):
+    """Return a callable testing *condition* against an lxml document.
+
+    *condition* is any ``wait_for`` value: an :class:`LxmlWaitExpression`,
+    or a string such as ``'element:css=#id'`` or ``'!element:xpath=//p'``.
+    Returns None for conditions that are always met by a browser without
+    JavaScript, such as ``'page'``, ``'ajax'`` and ``'duration'``.
+    ``'js:'`` conditions can not be evaluated and are also ignored;
+    ``dom=`` and ``ui=`` locators raise ValueError.
+
+    """
+    if not condition:
+        return None
+    if isinstance(condition, LxmlWaitExpression):
+        return condition.compile()
+    if isinstance(condition, WaitExpression):
+        return None
+    if condition.startswith('element:'):
+        return _present(_compile_locator(condition[8:]), True)
+    if condition.startswith('!element:'):
+        return _present(_compile_locator(condition[9:]), False)
+    return None
+
+
+def _any_of_all(groups):
+    """Return a predicate true if all terms of any group are true."""
+    groups = tuple(tuple(terms) for terms in groups)
+
+    def predicate(document):
+        for terms in groups:
+            for term in terms:
+                if not term(document):
+                    break
+            else:
+                return True
+        return False
+    return predicate
+
+
+def _present(find, expected):
+    def term(document):
+        return bool(find(document)) is expected
+    return term
+
+
+def _evaluate(find, expr):
+    def term(document):
+        elements = find(document)
+        return bool(elements) and bool(expr(elements[0]))
+    return term
+
+
+def _constant(find, value):
+    return lambda document: value
+
+
+_selector_cache = {}
+_selector_cache_size = 512
+_by_id = XPath('//*[@id=$value]')
+_by_name = XPath('//*[@name=$value]')
+
+
+def _cached_selector(kind, expr):
+    """Return a compiled CSSSelector or XPath for *expr*, cached by text."""
+    key = (kind, expr)
+    try:
+        return _selector_cache[key]
+    except KeyError:
+        pass
+    if len(_selector_cache) >= _selector_cache_size:
+        _selector_cache.clear()
+    compiled = _selector_cache[key] = kind(expr)
+    return compiled
+
+
+def _compile_finder(finder):
+    """Return a callable finding a CSS selector or element in documents."""
+    if isinstance(finder, basestring):
+        return _guarded(_cached_selector(CSSSelector, finder))
+    elif hasattr(finder, 'fq_xpath'):
+        # elements may come from an earlier document, so find their twin
+        # in the current one
+        if 'id' in finder.attrib:
+            return _compile_locator('id=' + finder.attrib['id'])
+        return _compile_locator('xpath=' + finder.fq_xpath)
+    else:
+        raise RuntimeError("Unknown page element %r" % finder)
+
+
+def _compile_locator(locator):
+    """Return a callable finding the Selenium-style *locator* in documents.
+
+    ``dom=`` and ``ui=`` locators (and bare ``document.`` expressions) are
+    JavaScript and raise ValueError, as do unknown strategies.
+
+    """
+    if locator.startswith('css='):
+        return _guarded(_cached_selector(CSSSelector, locator[4:]))
+    elif locator.startswith('xpath='):
+        return _guarded(_cached_selector(XPath, locator[6:]))
+    elif locator.startswith('//'):
+        return _guarded(_cached_selector(XPath, locator))
+    elif locator.startswith('id='):
+        return _guarded(_by_id, value=locator[3:])
+    elif locator.startswith('name='):
+        return _guarded(_by_name, value=locator[5:])
+    elif locator.startswith('link='):
+        return _link_finder(locator[5:])
+    elif locator.startswith(_javascript_locators):
+        raise ValueError("Locator %r needs JavaScript and can not be "
+                         "evaluated by this browser" % locator)
+    if locator.startswith('identifier='):
+        locator = locator[11:]
+    else:
+        strategy = _strategy.match(locator)
+        if strategy:
+            raise ValueError("Unknown locator strategy %r in %r" % (
+                strategy.group(1), locator))
+    by_id = _guarded(_by_id, value=locator)
+    by_name = _guarded(_by_name, value=locator)
+    return lambda document: by_id(document) or by_name(document)
+
+
+_javascript_locators = ('dom=', 'ui=', 'document.')
+_strategy = re.compile(r'^([A-Za-z]+)=')
+_anchors = XPath('//a')
+
+
+def _link_finder(pattern):
+    """Return a callable finding anchors whose text matches *pattern*.
+
+    As in Selenium, the text is whitespace-normalized and *pattern* is a
+    glob unless prefixed with ``exact:``, ``regexp:`` or ``regexpi:``.
+
+    """
+    if pattern.startswith('exact:'):
+        text = pattern[6:]
+        matches = lambda value: value == text
+    elif pattern.startswith('regexp:'):
+        matches = re.compile(pattern[7:]).search
+    elif pattern.startswith('regexpi:'):
+        matches = re.compile(pattern[8:], re.I).search
+    else:
+        if pattern.startswith('glob:'):
+            pattern = pattern[5:]
+        glob = re.escape(pattern).replace('\\*', '.*').replace('\\?', '.')
+        matches = re.compile(glob + '$', re.S).match
+
+    def find(document):
+        if document is None:
+            return []
+        return [anchor for anchor in _anchors(document)
+                if matches(' '.join(anchor.text_content().split()))]
+    return find
+
+
+def _guarded(selector, **variables):
+    """Wrap *selector* so that a missing document matches nothing."""
+    def find(document):
+        if document is None:
+            return []
+        return selector(document, **variables)
+    return find
+
+
+_compiled_cache = {}
+_compiled_cache_size = 512
+
+
+def _compiled(key, render, *args):
+    """Return the single-line JS for *key*, rendering it on first use."""
+    try:
+        return _compiled_cache[key]
+    except KeyError:
+        pass
+    if len(_compiled_cache) >= _compiled_cache_size:
+        _compiled_cache.clear()
+    js = _compiled_cache[key] = render(*args).replace('\n', ' ')
+    return js
+
+
+def _element_present_js(label, locator, result):
+    log = evaluation_log(label, 'found', locator)
+    return u"""\
+(function () {
+  var found = true;
+  try {
+    selenium.browserbot.findElement('%s');
+  } catch (e) {
+    found = false;
+  };
+  %s
+  return found == %s;
+})()""" % (js_quote(locator), log, result)
+
+
+def _evaluate_element_js(locator, expr):
+    log = evaluation_log('evaluate_element', 'result', locator, expr)
+    return u"""\
 (function () {
   var element;
   try {
@@ -124,57 +454,24 @@ class SeleniumWaitExpression(WaitExpression):
   %s
   return result;
 })()""" % (js_quote(locator), expr, log)
-        self._expressions.append(js)
-        return self
 
-    def ajax_pending(self):
-        js = """\
+
+def _ajax_pending_js():
+    return u"""\
 (function() {
   var pending = window.jQuery && window.jQuery.active != 0;
   %s
   return pending;
 })()""" % predicate_log('ajax_pending', 'complete')
-        self._expressions.append(js)
-        return self
 
-    def ajax_complete(self):
-        js = """\
+
+def _ajax_complete_js():
+    return u"""\
 (function() {
   var complete = window.jQuery ? window.jQuery.active == 0 : true;
   %s
   return complete;
 })()""" % predicate_log('ajax_complete', 'complete')
-        self._expressions.append(js)
-        return self
-
-    def _is_element_present(self, label, finder, result):
-        locator = to_locator(finder)
-        log = evaluation_log(label, 'found', locator)
-        return u"""\
-(function () {
-  var found = true;
-  try {
-    selenium.browserbot.findElement('%s');
-  } catch (e) {
-    found = false;
-  };
-  %s
-  return found == %s;
-})()""" % (js_quote(locator), log, result)
-
-    def __unicode__(self):
-        last = None
-        components = []
-        for expr in self._expressions:
-            if expr is OR:
-                components.append(u'||')
-            else:
-                if last not in (None, OR):
-                    components.append(u'&&')
-                components.append(expr)
-            last = expr
-        predicate = u' '.join(components).replace('\n', ' ')
-        return predicate
 
 
 def js_quote(string):
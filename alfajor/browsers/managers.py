@@ -6,9 +6,11 @@
 
 """Bridges between test runners and functional browsers."""
 
+import atexit
 from logging import getLogger
+import os
 
-from alfajor.utilities import ServerSubProcess, eval_dotted_path
+from alfajor.utilities import ServerPool, ServerSubProcess, eval_dotted_path
 
 
 logger = getLogger('alfajor')
@@ -23,6 +25,127 @@ def _verify_backend_config(config, required_keys):
                        missing_keys)
 
 
+def _apply_document_cache(browser, size):
+    """Give *browser* a document cache of *size* documents, if configured."""
+    if size and int(size) > 0:
+        from alfajor.browsers._lxml import DocumentCache
+        browser.document_cache = DocumentCache(int(size))
+    return browser
+
+
+def _flag(value):
+    """True unless *value* is a false-ish config string."""
+    return str(value).lower() not in ('false', 'no', 'off', '0')
+
+
+_run_http_caches = {}
+
+
+def _apply_http_cache(browser, scope, patterns, size=None):
+    """Give *browser* an HTTP cache for URLs matching *patterns*.
+
+    *scope* is 'browser' for a cache of the browser's own, or 'run' for a
+    cache shared by every browser with the same configuration for the
+    rest of the process.
+
+    """
+    if not (scope and patterns):
+        return browser
+    from alfajor.browsers._httpcache import HTTPCache
+    size = int(size or 128)
+    if scope == 'browser':
+        browser.http_cache = HTTPCache(patterns, size)
+    elif scope == 'run':
+        key = (patterns, size)
+        if key not in _run_http_caches:
+            _run_http_caches[key] = HTTPCache(patterns, size)
+        browser.http_cache = _run_http_caches[key]
+    else:
+        raise RuntimeError("http-cache must be 'browser' or 'run', not %r" %
+                           scope)
+    return browser
+
+
+_run_server_pools = {}
+_exit_hooks = set()
+
+
+def _run_server_pool(cmd, url, size, ping):
+    """The ServerPool shared by every manager with this configuration.
+
+    Pools live for the rest of the process and are stopped at exit.  A
+    forked test worker gets pools of its own.
+
+    """
+    pid = os.getpid()
+    key = (pid, cmd, url, size, ping)
+    if key not in _run_server_pools:
+        if pid not in _exit_hooks:
+            _exit_hooks.add(pid)
+            atexit.register(_stop_server_pools)
+            try:
+                from multiprocessing.util import Finalize
+            except ImportError:
+                pass
+            else:
+                # worker processes leave without running atexit hooks
+                Finalize(None, _stop_server_pools, exitpriority=10)
+        logger.info("Pooling %s server sub processes of %s", size, cmd)
+        _run_server_pools[key] = ServerPool(cmd, url, size, ping)
+    return _run_server_pools[key]
+
+
+def _stop_server_pools():
+    """Stop the pools this process started."""
+    pid = os.getpid()
+    for key in _run_server_pools.keys():
+        if key[0] == pid:
+            _run_server_pools.pop(key).stop()
+
+
+def _worker_index():
+    """The 0-based index of this multiprocess test worker, or None."""
+    try:
+        from multiprocessing import current_process
+    except ImportError:
+        return None
+    identity = current_process()._identity
+    if identity:
+        return identity[0] - 1
+    return None
+
+
+def _apply_recorder(browser, path):
+    """Record *browser*'s exchanges to the archive at *path*, if configured."""
+    if path:
+        from alfajor.recording import Recorder
+        browser.recorder = Recorder(path)
+    return browser
+
+
+def _close_recorder(browser):
+    """Close the archive *browser* records to, if any."""
+    recorder = getattr(browser, 'recorder', None)
+    if recorder is not None:
+        recorder.close()
+        browser.recorder = None
+
+
+def _apply_history(browser, size, memory=None):
+    """Give *browser* a history of *size* page loads, if configured.
+
+    Bodies beyond *memory* bytes in total are spilled to disk.
+
+    """
+    if size and int(size) > 0:
+        from alfajor.browsers._history import History
+        if memory:
+            browser.history = History(int(size), int(memory))
+        else:
+            browser.history = History(int(size))
+    return browser
+
+
 class SeleniumManager(object):
     """TODO
 
@@ -30,6 +153,8 @@ class SeleniumManager(object):
     cmd
     ping-address
     selenium-server
+    history-size
+    history-memory
 
     """
 
@@ -67,7 +192,10 @@ class SeleniumManager(object):
             logger.debug("Service started.")
         selenium_server = self._config('selenium-server',
                                        'http://localhost:4444')
-        self.browser = Selenium(selenium_server, self.browser_type, base_url)
+        self.browser = _apply_history(
+            Selenium(selenium_server, self.browser_type, base_url),
+            self._config('history-size', None),
+            self._config('history-memory', None))
         return self.browser
 
     def destroy(self):
@@ -99,6 +227,7 @@ class WSGIManager(object):
 
     def __init__(self, frontend_name, backend_config, runner_options):
         self.config = backend_config
+        self.browser = None
 
     def create(self):
         from alfajor.browsers.wsgi import WSGI
@@ -107,11 +236,24 @@ class WSGIManager(object):
         app = eval_dotted_path(entry_point)
 
         base_url = self.config.get('base_url')
+        keep_body = _flag(self.config.get('keep-body', 'true'))
         logger.debug("Created in-process WSGI browser.")
-        return WSGI(app, base_url)
+        browser = _apply_document_cache(
+            WSGI(app, base_url, keep_body),
+            self.config.get('document-cache-size'))
+        _apply_recorder(browser, self.config.get('record'))
+        _apply_http_cache(browser, self.config.get('http-cache'),
+                          self.config.get('http-cache-urls'),
+                          self.config.get('http-cache-size'))
+        self.browser = _apply_history(browser,
+                                      self.config.get('history-size'),
+                                      self.config.get('history-memory'))
+        return self.browser
 
     def destroy(self):
         logger.debug("Destroying in-process WSGI browser.")
+        _close_recorder(self.browser)
+        self.browser = None
 
 
 class NetworkManager(object):
@@ -120,6 +262,24 @@ class NetworkManager(object):
     server_url
     cmd
     ping-address
+    server-pool-size
+    document-cache-size
+    history-size
+    history-memory
+    record
+    http-cache
+    http-cache-urls
+    http-cache-size
+    accept-encoding
+    incremental-parse
+    max-body-size
+
+    If server-pool-size is set, up to that many servers are started from
+    cmd on ephemeral ports, once for the whole run, and browsers are
+    distributed among them: managers take them in turn, and each
+    multiprocess test worker uses (and starts) only the server at its
+    worker index.  ``$port`` in cmd, server_url and ping-address is
+    replaced with each server's port.
 
     """
 
@@ -127,14 +287,18 @@ class NetworkManager(object):
         self.config = backend_config
         self.runner_options = runner_options
         self.process = None
+        self.pool = None
         self.browser = None
         self.server_url = self._config('server_url', False)
         if not self.server_url:
             raise RuntimeError("'server_url' is a required configuration "
                                "option for the Network backend.")
+        self.pool_size = int(self._config('server-pool-size', 0) or 0)
 
     def _config(self, key, *default):
-        override = self.runner_options.get(key)
+        # command line options are named with underscores
+        override = (self.runner_options.get(key) or
+                    self.runner_options.get(key.replace('-', '_')))
         if override:
             return override
         if key in self.config:
@@ -150,18 +314,50 @@ class NetworkManager(object):
         if (self._config('without_server', False) or
             not self._config('cmd', False)):
             logger.debug("Connecting to existing URL %r", base_url)
+        elif self.pool_size:
+            if self.pool is None:
+                self.pool = self.start_pool()
+            worker = _worker_index()
+            if worker is not None:
+                base_url = self.pool.url_for(worker)
+            else:
+                if not self.pool.servers:
+                    logger.debug("Starting pool of %s services....",
+                                 self.pool_size)
+                    self.pool.start()
+                    logger.debug("Service pool started.")
+                base_url = self.pool.next_url()
+            logger.debug("Using pooled service at %r", base_url)
         else:
             logger.debug("Starting service....")
             self.process = self.start_subprocess()
             logger.debug("Service started.")
-        self.browser = Network(base_url)
+        self.browser = _apply_history(
+            _apply_document_cache(Network(base_url),
+                                  self._config('document-cache-size', None)),
+            self._config('history-size', None),
+            self._config('history-memory', None))
+        _apply_recorder(self.browser, self._config('record', None))
+        _apply_http_cache(self.browser, self._config('http-cache', None),
+                          self._config('http-cache-urls', None),
+                          self._config('http-cache-size', None))
+        self.browser.accept_encoding = _flag(
+            self._config('accept-encoding', 'true'))
+        self.browser.incremental_parse = _flag(
+            self._config('incremental-parse', 'false'))
+        max_body_size = self._config('max-body-size', None)
+        if max_body_size:
+            self.browser.max_body_size = int(max_body_size)
         return self.browser
 
     def destroy(self):
+        _close_recorder(self.browser)
         if self.process:
             self.process.stop()
+        # the pool is shared for the whole run and stopped at exit
         # avoid irritating __del__ exception on interpreter shutdown
         self.process = None
+        self.pool = None
         self.browser = None
 
     def start_subprocess(self):
@@ -173,6 +369,55 @@ class NetworkManager(object):
         process.start()
         return process
 
+    def start_pool(self):
+        """The run-wide pool for this configuration; servers start on use."""
+        cmd = self._config('cmd')
+        ping = self._config('ping-address', None)
+        if '$port' not in cmd:
+            raise RuntimeError("'cmd' must contain $port when "
+                               "server-pool-size is configured.")
+        return _run_server_pool(cmd, self.server_url, self.pool_size, ping)
+
+
+class ReplayManager(object):
+    """Lifecycle manager for browsers replaying a recorded archive.
+
+    archive
+    base_url
+    document-cache-size
+    history-size
+    history-memory
+
+    Pages are served in-process from an archive recorded with the
+    ``record`` option of the wsgi or network backends; the application
+    under test is never started.
+
+    """
+
+    def __init__(self, frontend_name, backend_config, runner_options):
+        self.config = backend_config
+        self.archive = None
+
+    def create(self):
+        from alfajor.browsers.wsgi import WSGI
+        from alfajor.recording import Archive, ArchiveApp
+
+        if self.archive is None:
+            self.archive = Archive(self.config['archive'])
+        base_url = self.config.get('base_url')
+        logger.debug("Created replay browser for %s.", self.archive.path)
+        browser = _apply_document_cache(
+            WSGI(ArchiveApp(self.archive), base_url),
+            self.config.get('document-cache-size'))
+        return _apply_history(browser, self.config.get('history-size'),
+                              self.config.get('history-memory'))
+
+    def destroy(self):
+        logger.debug("Destroying replay browser.")
+        if self.archive is not None:
+            self.archive.close()
+        self.archive = None
+
 
 class ZeroManager(object):
     """Lifecycle manager for global Zero browsers."""
@@ -8,19 +8,27 @@
 
 from __future__ import absolute_import
 from cookielib import Cookie, CookieJar
+import copy
+import io
 from logging import getLogger
+import mimetypes
+import os
+import re
+import sys
 import urllib2
 from urllib import urlencode
 from urlparse import urljoin
-from time import time
+from time import sleep, time
+from uuid import uuid4
+import zlib
 
 from blinker import signal
 from werkzeug import Headers
 
 from alfajor.browsers._lxml import DOMMixin, html_parser_for
-from alfajor.browsers._waitexpr import WaitExpression
+from alfajor.browsers._waitexpr import LxmlWaitExpression, lxml_predicate
 from alfajor.browsers.wsgi import wsgi_elements
-from alfajor.utilities import lazy_property
+from alfajor.utilities import lazy_property, to_pairs
 from alfajor._compat import property
 
 
@@ -35,9 +43,48 @@ class Network(DOMMixin):
     capabilities = [
         'cookies',
         'headers',
+        'upload',
         ]
 
-    wait_expression = WaitExpression
+    wait_expression = LxmlWaitExpression
+
+    wait_timeout = 5000
+    """Default milliseconds :meth:`wait_for` polls before giving up."""
+
+    wait_interval = 250
+    """Milliseconds between :meth:`wait_for` polls of the server."""
+
+    recorder = None
+    """An optional :class:`~alfajor.recording.Recorder` of exchanges."""
+
+    http_cache = None
+    """An optional :class:`~alfajor.browsers._httpcache.HTTPCache` of GETs.
+
+    Cached pages are revalidated with ``If-None-Match`` and
+    ``If-Modified-Since``; on a ``304 Not Modified`` the stored body and
+    parsed document are reused.
+
+    """
+
+    accept_encoding = True
+    """If true, ask for gzip or deflate compressed responses.
+
+    Compressed bodies are decoded as they are read.  Each operation's
+    :attr:`timing` counts the ``wire-bytes`` received and the decoded
+    ``body-bytes``.
+
+    """
+
+    incremental_parse = False
+    """If true, feed full HTML documents to the parser as they are read.
+
+    The document is then ready when :meth:`open` returns and the
+    ``document_cache`` is not consulted.
+
+    """
+
+    max_body_size = None
+    """If set, responses with bodies over this many (decoded) bytes fail."""
 
     user_agent = {
         'browser': 'network',
@@ -50,9 +97,21 @@ class Network(DOMMixin):
         self._base_url = base_url
         self.reset()
 
-    def open(self, url, wait_for=None, timeout=0):
-        """Open web page at *url*."""
-        self._open(url)
+    def open(self, url, wait_for=None, timeout=0, method='GET', data=None,
+             content_type=None):
+        """Open web page at *url*.
+
+        *method* may be GET, POST, PUT, PATCH, DELETE or HEAD.  *data* is
+        a mapping or sequence of name, value pairs, sent as the query
+        string of GET, HEAD and DELETE requests and as the body of the
+        others.  A value may be a ``(path, mimetype)`` tuple to upload a
+        file, streamed from disk as ``multipart/form-data``.  A string or
+        file-like *data* is sent as the body as is, with *content_type*.
+
+        """
+        self._open(url, method, data, content_type=content_type)
+        if wait_for:
+            self.wait_for(wait_for, timeout)
 
     def reset(self):
         self._referrer = None
@@ -68,7 +127,28 @@ class Network(DOMMixin):
         self.headers = ()
 
     def wait_for(self, condition, timeout=None):
-        pass
+        """Wait until *condition* holds for the current page.
+
+        The condition is checked against the current document and, while it
+        does not hold, the page is re-fetched every :attr:`wait_interval`
+        milliseconds for up to *timeout* (or :attr:`wait_timeout`)
+        milliseconds.  Conditions that need JavaScript (``js:``) are
+        ignored, and ``dom=`` and ``ui=`` locators raise ValueError.
+
+        """
+        predicate = lxml_predicate(condition)
+        if predicate is None:
+            return
+        if not timeout:
+            timeout = self.wait_timeout
+        deadline = time() + timeout / 1000.0
+        while not predicate(self.document):
+            if time() >= deadline:
+                raise AssertionError(
+                    "wait_for condition %r not met by %s after %sms" % (
+                        condition, self.location, timeout))
+            sleep(self.wait_interval / 1000.0)
+            self._open(self.location, refer=False)
 
     def sync_document(self):
         """The document is always synced."""
@@ -117,47 +197,126 @@ class Network(DOMMixin):
     def _open(self, url, method='GET', data=None, refer=True,
               content_type=None):
         before_browser_activity.send(self)
-        open_started = time()
+        timing = self._begin_timing('open', url)
+        try:
+            self._fetch(timing, url, method, data, refer, content_type)
+        except:
+            # failed requests are timed and reported too
+            exc_info = sys.exc_info()
+            timing.count('errors')
+            self._end_timing(timing)
+            after_browser_activity.send(self)
+            raise exc_info[0], exc_info[1], exc_info[2]
+        self._end_timing(timing)
+        after_browser_activity.send(self)
 
-        if data:
-            data = urlencode(data)
+    def _fetch(self, timing, url, method, data, refer, content_type):
+        """Request *url* and load the response, timed by *timing*."""
+        open_started = time()
 
+        method = method.upper()
+        if method not in _methods:
+            raise Exception('Unsupported method: %s' % method)
         url = urljoin(self._base_url, url)
-        if method == 'GET':
+        body = None
+        if _is_raw(data):
+            if method in ('GET', 'HEAD'):
+                raise ValueError('%s requests can not have a body' % method)
+            assert content_type is not None, 'content type required'
+            if isinstance(data, unicode):
+                data = data.encode('utf-8')
+            body = data
+        elif method in ('GET', 'HEAD', 'DELETE'):
             if '?' in url:
                 url, query_string = url.split('?', 1)
             else:
                 query_string = None
 
             if data:
-                query_string = data
+                query_string = urlencode(_encoded_pairs(data))
             if query_string:
                 url = url + '?' + query_string
-
-            request = urllib2.Request(url)
-        elif method == 'POST':
-            request = urllib2.Request(url, data)
         else:
-            raise Exception('Unsupported method: %s' % method)
+            pairs = _encoded_pairs(data or ())
+            if ((content_type or '').startswith('multipart/form-data') or
+                any(isinstance(value, tuple) for key, value in pairs)):
+                body = _MultipartBody(pairs)
+                content_type = body.content_type
+            else:
+                body = urlencode(pairs)
+                content_type = 'application/x-www-form-urlencoded'
+
+        length = None
+        if body is not None:
+            body, length = _sized_body(body)
+        request = _Request(url, body, method)
+        if body is not None:
+            request.add_header('Content-Type', content_type)
+            request.add_header('Content-Length', str(length))
         if self._referrer and refer:
             request.add_header('Referer', self._referrer)
+        if self.accept_encoding:
+            request.add_header('Accept-Encoding', 'gzip, deflate')
 
         logger.info('%s(%s)', url, method)
         request_started = time()
+        timing.add('prepare', request_started - open_started)
 
-        response = self._opener.open(request)
-
-        request_ended = time()
-
-        self.status_code = response.getcode()
-        self.headers = Headers(
-            (head.strip().split(': ',1) for head in response.info().headers)
-        )
-        self._referrer = request.get_full_url()
-        self.location = response.geturl()
-        self._response = response
-        self.response = ''.join(list(response))
-        self._sync_document()
+        full_url = request.get_full_url()
+        cache = self.http_cache
+        if cache is None or method != 'GET' or not cache.allows(full_url):
+            cache = cached = None
+        else:
+            cached = cache.lookup(full_url)
+        response = None
+        if cached is not None and cached.fresh:
+            timing.count('cache-hits')
+        else:
+            if cached is not None:
+                for key, value in cached.validators():
+                    request.add_header(key, value)
+            try:
+                response = self._opener.open(request)
+            except urllib2.HTTPError, exc:
+                if cached is None or exc.code != 304:
+                    raise
+                timing.count('cache-revalidations')
+                cached.revalidated(_header_pairs(exc.info()))
+
+        response_started = time()
+        timing.add('request', response_started - request_started)
+
+        self._referrer = full_url
+        if response is None:
+            self.status_code = 200
+            self.headers = Headers(cached.headers)
+            self.location = full_url
+            self.response = cached.body
+            request_ended = time()
+            self._sync_document()
+            self._reuse_document(cached)
+        else:
+            self.status_code = response.getcode()
+            self.headers = Headers(_header_pairs(response.info()))
+            self.location = response.geturl()
+            if self.location != full_url:
+                timing.count('redirects')
+            self._response = response
+            self.response, document = self._read_body(response, timing)
+            if method == 'HEAD':
+                self.response = None
+            request_ended = time()
+            if cache is not None and self.location == full_url:
+                cache.store(full_url, self.status_code,
+                            '%s %s' % (response.code, response.msg),
+                            list(self.headers), self.response)
+            self._sync_document()
+            if document is not None:
+                self.__dict__['document'] = document
+        if self.history is not None:
+            self._record_history(method, self.location)
+        if self.recorder is not None and response is not None:
+            self._record_exchange(request, response)
 
         open_ended = time()
         request_time = request_ended - request_started
@@ -165,5 +324,292 @@ class Network(DOMMixin):
         logger.info("Fetched %s in %0.3fsec + %0.3fsec browser overhead",
                     url, request_time,
                     open_ended - open_started - request_time)
-        after_browser_activity.send(self)
 
+    def _read_body(self, response, timing):
+        """Read and decode the body of *response* in fixed-size chunks.
+
+        Returns the body and, if :attr:`incremental_parse` is on and the
+        body is a full HTML document, its document as parsed during the
+        read (else None).  Bytes received and decoded are counted in
+        *timing*.
+
+        """
+        started = time()
+        info = response.info()
+        decoder = _decoder_for(
+            info.get('Content-Encoding', '').strip().lower())
+        limit = self.max_body_size
+        if limit is not None and decoder is None:
+            length = info.get('Content-Length', '').strip()
+            if length.isdigit() and int(length) > limit:
+                response.close()
+                raise AssertionError(
+                    "%s is %s bytes, over max_body_size of %s bytes" % (
+                        response.geturl(), length, limit))
+        parser, undecided = None, self.incremental_parse
+        chunks, received, size, parsing = [], 0, 0, 0.0
+        try:
+            for n, data in _read_chunks(response, decoder):
+                received += n
+                if not data:
+                    continue
+                size += len(data)
+                if limit is not None and size > limit:
+                    response.close()
+                    raise AssertionError(
+                        "%s is over max_body_size of %s bytes" % (
+                            response.geturl(), limit))
+                chunks.append(data)
+                if undecided:
+                    undecided = False
+                    if _full_html(data):
+                        parser = self._lxml_parser
+                if parser is not None:
+                    parse_started = time()
+                    parser.feed(data)
+                    parsing += time() - parse_started
+        except:
+            if parser is not None:
+                # leave the shared parser ready for the next document
+                try:
+                    parser.close()
+                except Exception:
+                    pass
+            raise
+        body = ''.join(chunks)
+        document = None
+        if parser is not None:
+            parse_started = time()
+            document = parser.close()
+            parsing += time() - parse_started
+            timing.add('parse', parsing)
+        timing.add('body', time() - started - parsing)
+        timing.count('wire-bytes', received)
+        timing.count('body-bytes', size)
+        return body, document
+
+    def _reuse_document(self, entry):
+        """Install a copy of the document parsed for a cached *entry*."""
+        document = entry.document
+        # documents are bound to the browser that parsed them
+        if document is not None and document.browser is self:
+            self.__dict__['document'] = copy.deepcopy(document)
+        elif self.document is not None:
+            entry.document = copy.deepcopy(self.document)
+
+    def _record_exchange(self, request, response):
+        """Pass the completed exchange to :attr:`recorder`."""
+        url = request.get_full_url()
+        data = request.get_data()
+        if not isinstance(data, basestring):
+            # streamed bodies have been sent and are not recorded
+            data = ''
+        content_type = request.get_header('Content-type')
+        method = request.get_method()
+        if self.location != url:
+            # urllib2 followed redirects; record a hop to the final page
+            self.recorder.record(method, url, data, content_type,
+                                 '302 Found', [('Location', self.location)],
+                                 '')
+            method, data, content_type = 'GET', '', None
+        self.recorder.record(method, self.location, data, content_type,
+                             '%s %s' % (response.code, response.msg),
+                             [(key, value) for key, value in self.headers
+                              if key.lower() not in _encoding_headers],
+                             self.response)
+
+
+class _Request(urllib2.Request):
+    """A urllib2 request for any HTTP *method*."""
+
+    def __init__(self, url, data=None, method='GET'):
+        urllib2.Request.__init__(self, url, data)
+        self.method = method
+
+    def get_method(self):
+        return self.method
+
+
+class _MultipartBody(object):
+    """A ``multipart/form-data`` body read from memory and disk as sent.
+
+    *pairs* values are strings, or ``(path, mimetype)`` tuples for files,
+    which are opened only when their part is reached.
+
+    """
+
+    def __init__(self, pairs):
+        self.boundary = '----------AlfajorFormPart_%s' % uuid4().hex
+        self.content_type = ('multipart/form-data; boundary=%s' %
+                             self.boundary)
+        parts = []
+        for key, value in pairs:
+            if isinstance(value, tuple):
+                path, mimetype = (value + (None,))[:2]
+                if not mimetype:
+                    mimetype = (mimetypes.guess_type(path)[0] or
+                                'application/octet-stream')
+                filename = _quoted(os.path.basename(path))
+                parts.append(
+                    '--%s\r\nContent-Disposition: form-data; name="%s"; '
+                    'filename="%s"\r\nContent-Type: %s\r\n\r\n' % (
+                        self.boundary, _quoted(key), filename, mimetype))
+                parts.append(_FilePart(path))
+                parts.append('\r\n')
+            else:
+                parts.append(
+                    '--%s\r\nContent-Disposition: form-data; '
+                    'name="%s"\r\n\r\n%s\r\n' % (self.boundary, _quoted(key),
+                                                  value))
+        parts.append('--%s--\r\n' % self.boundary)
+        self.length = sum(len(part) for part in parts)
+        self._parts = parts
+        self._file = None
+
+    def read(self, size=-1):
+        if size < 0:
+            size = self.length
+        chunks = []
+        while size > 0 and self._parts:
+            part = self._parts[0]
+            if isinstance(part, _FilePart):
+                if self._file is None:
+                    self._file = open(part.path, 'rb')
+                chunk = self._file.read(size)
+                if not chunk:
+                    self._file.close()
+                    self._file = None
+                    self._parts.pop(0)
+                    continue
+            else:
+                chunk = part[:size]
+                if len(chunk) < len(part):
+                    self._parts[0] = part[size:]
+                else:
+                    self._parts.pop(0)
+            chunks.append(chunk)
+            size -= len(chunk)
+        return ''.join(chunks)
+
+    def __len__(self):
+        return self.length
+
+
+class _FilePart(object):
+    """A file to upload, sized but not opened until it is read."""
+
+    __slots__ = ('path', 'size')
+
+    def __init__(self, path):
+        self.path = path
+        self.size = os.path.getsize(path)
+
+    def __len__(self):
+        return self.size
+
+
+_methods = set(['GET', 'POST', 'PUT', 'PATCH', 'DELETE', 'HEAD'])
+
+
+def _is_raw(data):
+    """True if *data* is a body to send as is."""
+    return isinstance(data, basestring) or hasattr(data, 'read')
+
+
+def _sized_body(body):
+    """*body* and the number of bytes it will send.
+
+    Strings and multipart bodies know their length.  Files send the rest
+    of their contents; file-likes that can not be measured are read into
+    a string.
+
+    """
+    if isinstance(body, basestring) or isinstance(body, _MultipartBody):
+        return body, len(body)
+    try:
+        return body, os.fstat(body.fileno()).st_size - body.tell()
+    except (AttributeError, IOError, OSError, io.UnsupportedOperation):
+        pass
+    try:
+        position = body.tell()
+        body.seek(0, 2)
+        end = body.tell()
+        body.seek(position)
+        return body, end - position
+    except (AttributeError, IOError, OSError, io.UnsupportedOperation):
+        body = body.read()
+        return body, len(body)
+
+
+def _quoted(value):
+    """*value* escaped for a quoted Content-Disposition parameter."""
+    return value.replace('"', '\\"')
+
+
+def _encoded_pairs(data):
+    """*data* as name, value pairs of UTF-8 encoded strings."""
+    pairs = []
+    for key, value in to_pairs(data):
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        pairs.append((key, value))
+    return pairs
+
+
+def _header_pairs(message):
+    """(key, value) pairs of the headers in an httplib *message*."""
+    return [head.strip().split(': ', 1) for head in message.headers]
+
+
+_read_size = 64 * 1024
+
+_full_html = re.compile(r'^\s*<(?:html|!doctype)', re.I).match
+
+
+def _read_chunks(response, decoder):
+    """Yield (bytes received, decoded data) for each read of *response*."""
+    while True:
+        chunk = response.read(_read_size)
+        if not chunk:
+            break
+        if decoder is None:
+            yield len(chunk), chunk
+        else:
+            yield len(chunk), decoder.decompress(chunk)
+    if decoder is not None:
+        yield 0, decoder.flush()
+
+# describe the body as sent, not as decoded
+_encoding_headers = set(['content-encoding', 'content-length'])
+
+
+def _decoder_for(content_encoding):
+    """A zlib decompressor for *content_encoding*, or None for identity."""
+    if content_encoding in ('gzip', 'x-gzip'):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if content_encoding == 'deflate':
+        return _DeflateDecoder()
+    return None
+
+
+class _DeflateDecoder(object):
+    """Decodes 'deflate' bodies, zlib-wrapped or (as some servers send) raw."""
+
+    def __init__(self):
+        self._decoder = None
+
+    def decompress(self, data):
+        if self._decoder is None:
+            self._decoder = zlib.decompressobj()
+            try:
+                return self._decoder.decompress(data)
+            except zlib.error:
+                self._decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self._decoder.decompress(data)
+
+    def flush(self):
+        if self._decoder is None:
+            return ''
+        return self._decoder.flush()
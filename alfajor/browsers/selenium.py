@@ -33,7 +33,11 @@ from alfajor.browsers._lxml import (
     _options_xpath,
     html_parser_for,
     )
-from alfajor.browsers._waitexpr import SeleniumWaitExpression, WaitExpression
+from alfajor.browsers._waitexpr import (
+    SeleniumWaitExpression,
+    WaitExpression,
+    js_quote,
+    )
 from alfajor.utilities import lazy_property
 from alfajor._compat import property
 
@@ -43,6 +47,7 @@ logger = getLogger('tests.browser')
 after_browser_activity = signal('after_browser_activity')
 before_browser_activity = signal('before_browser_activity')
 _enterable_chars_re = re.compile(r'(\\[a-z]|\\\d+|.)')
+_whitespace_re = re.compile(r'\s')
 csv.register_dialect('cookies', delimiter=';',
                      skipinitialspace=True,
                      quoting=csv.QUOTE_NONE)
@@ -63,6 +68,7 @@ class Selenium(DOMMixin):
                  default_timeout=16000):
         self.selenium = SeleniumRemote(
             server_url, browser_cmd, default_timeout)
+        self.selenium.observer = self._record_command
         self._base_url = base_url
 
         self.status_code = 0
@@ -73,6 +79,7 @@ class Selenium(DOMMixin):
     def open(self, url, wait_for='page', timeout=None):
         logger.info('open(%s)', url)
         before_browser_activity.send(self)
+        timing = self._begin_timing('open', url)
         if self._base_url:
             url = urljoin(self._base_url, url)
         if not self.selenium._session_id:
@@ -82,8 +89,15 @@ class Selenium(DOMMixin):
         self.selenium.open(url, timeout)
         if wait_for != 'page':
             self.wait_for(wait_for, timeout)
+        self._end_timing(timing)
         after_browser_activity.send(self)
         self.sync_document()
+        if self.history is not None:
+            self._record_history('GET', url)
+
+    def _record_command(self, command, seconds):
+        """Charge a Selenium RC round trip to the running operation."""
+        self._add_timing('rc', seconds)
 
     def reset(self):
         self.selenium('deleteAllVisibleCookies')
@@ -102,6 +116,7 @@ class Selenium(DOMMixin):
     def sync_document(self):
         self.response = '<html>' + self.selenium('getHtmlSource') + '</html>'
         self.__dict__.pop('document', None)
+        self.__dict__.pop('_document_index', None)
 
     @property
     def location(self):
@@ -112,7 +127,11 @@ class Selenium(DOMMixin):
             if not condition:
                 return
             if isinstance(condition, WaitExpression):
-                condition = u'js:' + unicode(condition)
+                predicate = unicode(condition)
+                if not predicate:
+                    return
+                condition = u'js:' + self.selenium.register_predicate(
+                    predicate)
 
             if condition == 'duration':
                 if timeout:
@@ -125,12 +144,12 @@ class Selenium(DOMMixin):
             elif condition == 'ajax':
                 js = ('selenium.browserbot.getCurrentWindow()'
                       '.jQuery.active == 0;')
-                self.selenium('waitForCondition', js, timeout)
+                self.selenium.wait_for_condition(js, timeout)
             elif condition.startswith('js:'):
                 expr = condition[3:]
                 js = ('var window = selenium.browserbot.getCurrentWindow(); ' +
                       expr)
-                self.selenium('waitForCondition', js, timeout)
+                self.selenium.wait_for_condition(js, timeout)
             elif condition.startswith('element:'):
                 expr = condition[8:]
                 self.selenium.wait_for_element_present(expr, timeout)
@@ -140,6 +159,33 @@ class Selenium(DOMMixin):
         except RuntimeError, detail:
             raise AssertionError('Selenium encountered an error:  %s' % detail)
 
+    def visible(self, elements):
+        """Return a list of the visibility of *elements*.
+
+        Visibility of all elements is evaluated by one script in the page,
+        costing a single Selenium round trip.
+
+        """
+        locators = [u"'%s'" % js_quote(element._locator)
+                    for element in elements]
+        if not locators:
+            return []
+        js = u"""\
+(function (selenium) {
+  var locators = [%s];
+  var results = [];
+  for (var i = 0; i < locators.length; i++) {
+    try {
+      results.push(selenium.isVisible(locators[i]));
+    } catch (e) {
+      results.push(false);
+    }
+  }
+  return results.join(',');
+})(this)""" % u', '.join(locators)
+        flags = self.selenium('getEval', js.replace('\n', ' '))
+        return [flag == u'true' for flag in flags.split(',')]
+
     @property
     def cookies(self):
         """A dictionary of cookie names and values."""
@@ -175,11 +221,15 @@ class SeleniumRemote(object):
         self._session_id = None
         self._default_timeout = default_timeout
         self._current_timeout = None
+        self._predicates = {}
+        #: Called with (command, seconds) after each RC round trip.
+        self.observer = None
 
     def get_new_browser_session(self, browser_url, extension_js='', **options):
         opts = ';'.join("%s=%s" % item for item in options.items())
         self._session_id = self('getNewBrowserSession', self._browser_cmd,
                                 browser_url, extension_js, opts)
+        self._predicates = {}
         self.set_timeout(self._default_timeout)
         self._user_agent = self.get_eval('navigator.userAgent')
 
@@ -188,6 +238,25 @@ class SeleniumRemote(object):
     def test_complete(self):
         self('testComplete')
         self._session_id = None
+        self._predicates = {}
+
+    def register_predicate(self, js):
+        """Install the JavaScript predicate *js* in the browser session.
+
+        Returns a short JavaScript expression that evaluates the predicate,
+        suitable for :meth:`wait_for_condition`.  The predicate is sent to
+        the browser only the first time it is registered in a session.
+
+        """
+        try:
+            return self._predicates[js]
+        except KeyError:
+            pass
+        handle = len(self._predicates)
+        self('getEval', _register_predicate_js % (handle, js))
+        call = self._predicates[js] = (
+            'selenium.alfajorPredicates[%s]()' % handle)
+        return call
 
     testComplete = test_complete
 
@@ -205,7 +274,10 @@ class SeleniumRemote(object):
             'Content-Type':
             'application/x-www-form-urlencoded; charset=utf-8'})
         logger.debug('selenium(%s, %r)', command, args)
+        started = time.time()
         response = urlopen(request).read()
+        if self.observer is not None:
+            self.observer(command, time.time() - started)
 
         if not response.startswith('OK'):
             raise RuntimeError(response.encode('utf-8'))
@@ -261,12 +333,26 @@ class SeleniumRemote(object):
             self('open', url, 'true')
 
     def wait_for_element_present(self, expression, timeout=None):
-        with self._scoped_timeout(timeout):
-            self('waitForElementPresent', expression)
+        self.wait_for_condition(
+            "selenium.isElementPresent('%s')" % js_quote(expression), timeout)
 
     def wait_for_element_not_present(self, expression, timeout=None):
-        with self._scoped_timeout(timeout):
-            self('waitForElementNotPresent', expression)
+        self.wait_for_condition(
+            "!selenium.isElementPresent('%s')" % js_quote(expression),
+            timeout)
+
+    def wait_for_condition(self, js, timeout=None):
+        """Wait until the JavaScript expression *js* is true.
+
+        The condition is polled inside the browser and Selenium answers once
+        it holds (or *timeout* expires), all in a single round trip.  The
+        timeout travels with the command, so the session timeout is left
+        untouched.
+
+        """
+        if timeout is None:
+            timeout = self._current_timeout
+        self('waitForCondition', js, timeout)
 
     @contextmanager
     def _scoped_timeout(self, timeout):
@@ -298,6 +384,16 @@ class SeleniumRemote(object):
                 self.set_timeout(current_timeout)
 
 
+_register_predicate_js = (
+    "(function (selenium) {"
+    " var predicates = selenium.alfajorPredicates ||"
+    " (selenium.alfajorPredicates = {});"
+    " predicates[%s] = function () {"
+    " var window = selenium.browserbot.getCurrentWindow();"
+    " return (%s); };"
+    " return 'OK';"
+    " })(this)")
+
 _transformers = {
     'unicode': lambda d: unicode(d, 'utf-8'),
     'int': int,
@@ -318,13 +414,17 @@ def event_sender(name):
 
     def handler(self, wait_for=None, timeout=None):
         before_browser_activity.send(self.browser)
+        timing = self.browser._begin_timing(name)
         self.browser.selenium(selenium_name, self._locator)
         # XXX:dc: when would a None wait_for be a good thing?
         if wait_for:
             self.browser.wait_for(wait_for, timeout)
         time.sleep(0.2)
+        self.browser._end_timing(timing)
         after_browser_activity.send(self.browser)
         self.browser.sync_document()
+        if self.browser.history is not None:
+            self.browser._record_history(name, self.browser.location)
     handler.__name__ = name
     handler.__doc__ = "Emit %s on this element." % selenium_name
     return handler
@@ -533,11 +633,22 @@ class DOMElement(DOMElement):
 
     @property
     def _locator(self):
-        """The fastest Selenium locator expression for this element."""
-        try:
-            return 'id=' + self.attrib['id']
-        except KeyError:
-            return 'xpath=' + self.fq_xpath
+        """The fastest Selenium locator expression for this element.
+
+        In order of preference: a unique id, a unique name, an XPath
+        relative to the nearest ancestor with a unique id, and finally the
+        element's absolute XPath.  Uniqueness is judged against the
+        browser's current document; elements from an older document fall
+        back to their id or absolute XPath.
+
+        """
+        index = self._document_index
+        if index is None or self not in index.paths:
+            try:
+                return 'id=' + self.attrib['id']
+            except KeyError:
+                return 'xpath=' + self.fq_xpath
+        return _shortest_locator(self, index)
 
     click = event_sender('click')
     double_click = event_sender('double_click')
@@ -548,7 +659,9 @@ class DOMElement(DOMElement):
 
     def fire_event(self, name):
         before_browser_activity.send(self.browser)
+        timing = self.browser._begin_timing(name)
         self.browser.selenium('fireEvent', self._locator, name)
+        self.browser._end_timing(timing)
         after_browser_activity.send(self.browser)
 
     @property
@@ -556,6 +669,23 @@ class DOMElement(DOMElement):
         return self.browser.selenium.is_visible(self._locator)
 
 
+def _shortest_locator(element, index):
+    """Return the shortest reliable locator for *element* in *index*."""
+    id = element.get('id')
+    if id and index.ids[id] == 1:
+        return 'id=' + id
+    name = element.get('name')
+    if name and index.names[name] == 1 and not _whitespace_re.search(name):
+        return 'name=' + name
+    path = index.paths[element]
+    for ancestor in element.iterancestors():
+        id = ancestor.get('id')
+        if id and index.ids[id] == 1 and "'" not in id:
+            anchor = index.paths[ancestor]
+            return "xpath=//*[@id='%s']%s" % (id, path[len(anchor):])
+    return 'xpath=' + path
+
+
 selenium_elements = {
     '*': DOMElement,
     'form': FormElement,
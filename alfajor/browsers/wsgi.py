@@ -9,6 +9,7 @@
 from __future__ import absolute_import
 import cookielib
 from cookielib import Cookie
+import copy
 import dummy_threading
 from cStringIO import StringIO
 from logging import getLogger
@@ -40,7 +41,8 @@ from alfajor.browsers._lxml import (
     TextareaElement,
     html_parser_for,
     )
-from alfajor.browsers._waitexpr import WaitExpression
+from alfajor.browsers._waitexpr import LxmlWaitExpression, lxml_predicate
+from alfajor.recording import request_body
 from alfajor.utilities import lazy_property, to_pairs
 from alfajor._compat import property
 
@@ -60,7 +62,7 @@ class WSGI(DOMMixin):
         'status',
         ]
 
-    wait_expression = WaitExpression
+    wait_expression = LxmlWaitExpression
 
     _wsgi_server = {
         'multithread': False,
@@ -74,10 +76,22 @@ class WSGI(DOMMixin):
         'version': '1.0',
         }
 
-    def __init__(self, wsgi_app, base_url=None):
+    #: An optional :class:`~alfajor.utilities.RequestProfiler`.
+    profiler = None
+
+    #: An optional :class:`~alfajor.recording.Recorder`.
+    recorder = None
+
+    #: An optional :class:`~alfajor.browsers._httpcache.HTTPCache` of GETs.
+    http_cache = None
+
+    def __init__(self, wsgi_app, base_url=None, keep_body=True):
         # accept additional request headers?  (e.g. user agent)
         self._wsgi_app = wsgi_app
         self._base_url = base_url
+        #: If False, :attr:`response` is released once the document has
+        #: been parsed, for tests that only need the DOM.
+        self.keep_body = keep_body
         self._referrer = None
         self._request_environ = None
         self._cookie_jar = CookieJar()
@@ -90,10 +104,31 @@ class WSGI(DOMMixin):
     def open(self, url, wait_for=None, timeout=0):
         """Open web page at *url*."""
         self._open(url, refer=False)
+        if wait_for:
+            self.wait_for(wait_for, timeout)
 
     def reset(self):
         self._cookie_jar = CookieJar()
 
+    def snapshot(self):
+        """Capture the browser's current state for later :meth:`restore`.
+
+        The snapshot holds copies of the cookie jar, referrer, request
+        environ, response and parsed :attr:`document`, so a fixture can
+        e.g. log in once and restore the logged-in page for each test.
+
+        """
+        return _Snapshot(self)
+
+    def restore(self, snapshot):
+        """Return the browser to the state captured in *snapshot*.
+
+        A snapshot may be restored any number of times; changes made to the
+        restored document do not alter the snapshot.
+
+        """
+        snapshot.apply(self)
+
     @property
     def location(self):
         if not self._request_environ:
@@ -101,7 +136,18 @@ class WSGI(DOMMixin):
         return request_uri(self._request_environ)
 
     def wait_for(self, condition, timeout=None):
-        pass
+        """Assert that *condition* holds for the current document.
+
+        Requests are synchronous and nothing changes the page behind the
+        browser's back, so the condition is checked once, immediately.
+        Conditions that need JavaScript (``js:``) are ignored, and
+        ``dom=`` and ``ui=`` locators raise ValueError.
+
+        """
+        predicate = lxml_predicate(condition)
+        if predicate is not None and not predicate(self.document):
+            raise AssertionError("wait_for condition %r is not met by %s" % (
+                condition, self.location))
 
     def sync_document(self):
         """The document is always synced."""
@@ -154,35 +200,61 @@ class WSGI(DOMMixin):
 
     def _open(self, url, method='GET', data=None, refer=True, content_type=None):
         before_browser_activity.send(self)
+        timing = self._begin_timing('open', url)
         open_started = time()
         environ = self._create_environ(url, method, data, refer, content_type)
         # keep a copy, the app may mutate the environ
         request_environ = dict(environ)
 
-        logger.info('%s(%s) == %s', method, url, request_uri(environ))
+        uri = request_uri(environ)
+        logger.info('%s(%s) == %s', method, url, uri)
         request_started = time()
-        rv = run_wsgi_app(self._wsgi_app, environ)
-        response = BaseResponse(*rv)
-        # TODO:
-        # response.make_sequence()  # werkzeug 0.6+
-        # For now, must:
-        response.response = list(response.response)
-        if hasattr(rv[0], 'close'):
-            rv[0].close()
-        # end TODO
-
-        # request is complete after the app_iter (rv[0]) has been fully read +
-        # closed down.
+        timing.add('environ', request_started - open_started)
+        recorder = self.recorder
+        if recorder is not None:
+            sent_body = request_body(environ)
+        cache = self.http_cache
+        if cache is None or method != 'GET' or not cache.allows(uri):
+            cache = cached = None
+        else:
+            cached = cache.lookup(uri)
+        if cached is not None and cached.fresh:
+            timing.count('cache-hits')
+            response = BaseResponse(cached.body, cached.status,
+                                    cached.headers)
+        else:
+            if cached is not None:
+                for key, value in cached.validators():
+                    environ['HTTP_' + key.upper().replace('-', '_')] = value
+            response = self._call_app(environ, uri, timing)
+            if cached is not None and response.status_code == 304:
+                timing.count('cache-revalidations')
+                cached.revalidated(list(response.headers))
+                response = BaseResponse(cached.body, cached.status,
+                                        cached.headers)
+            elif cache is not None:
+                cache.store(uri, response.status_code, response.status,
+                            list(response.headers), response.data)
+            if recorder is not None:
+                recorder.record(method, uri, sent_body,
+                                request_environ.get('CONTENT_TYPE'),
+                                response.status, response.headers,
+                                response.data)
         request_ended = time()
 
         self._request_environ = request_environ
         self._cookie_jar.extract_from_werkzeug(response, environ)
+        timing.add('cookies', time() - request_ended)
         self.status_code = response.status_code
         # Automatically follow redirects
         if 301 <= self.status_code <= 302:
-            logger.debug("Redirect to %s", response.headers['Location'])
+            location = response.headers['Location']
+            del response
+            logger.debug("Redirect to %s", location)
+            timing.count('redirects')
+            self._end_timing(timing)
             after_browser_activity.send(self)
-            self._open(response.headers['Location'])
+            self._open(location)
             return
         # redirects report the original referrer
         self._referrer = request_uri(environ)
@@ -190,6 +262,7 @@ class WSGI(DOMMixin):
         self.headers = response.headers
         # TODO: unicodify
         self.response = response.data
+        del response
         self._sync_document()
 
         # TODO: what does a http-equiv redirect report for referrer?
@@ -199,17 +272,51 @@ class WSGI(DOMMixin):
                 parts = refresh.get('content').split(';url=', 1)
                 if len(parts) == 2:
                     logger.debug("HTTP-EQUIV Redirect to %s", parts[1])
+                    timing.count('redirects')
+                    self._end_timing(timing)
                     after_browser_activity.send(self)
                     self._open(parts[1])
                     return
+        if self.history is not None:
+            self._record_history(method, self.location)
+        if not self.keep_body:
+            # the document is parsed; let the raw body go
+            self.response = None
 
         open_ended = time()
         request_time = request_ended - request_started
         logger.info("Fetched %s in %0.3fsec + %0.3fsec browser overhead",
                     url, request_time,
                     open_ended - open_started - request_time)
+        self._end_timing(timing)
         after_browser_activity.send(self)
 
+    def _call_app(self, environ, uri, timing):
+        """Run the application for *environ*; returns a BaseResponse."""
+        app_started = time()
+        profiler = self.profiler
+        if profiler is not None and profiler.wants(uri):
+            rv = profiler.call(uri, run_wsgi_app, self._wsgi_app, environ,
+                               buffered=True)
+        else:
+            rv = run_wsgi_app(self._wsgi_app, environ)
+        app_ended = time()
+        timing.add('app', app_ended - app_started)
+        app_iter, status, headers = rv
+        del rv
+        # Drain the body into a single buffer and release the chunks.
+        try:
+            body = ''.join(app_iter)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+        del app_iter
+        response = BaseResponse(body, status, headers)
+        # request is complete after the app_iter has been fully read +
+        # closed down.
+        timing.add('drain', time() - app_ended)
+        return response
+
     def _create_environ(self, url, method, data, refer, content_type=None):
         """Return an environ to request *url*, including cookies."""
         environ_args = dict(self._wsgi_server, method=method)
@@ -306,6 +413,8 @@ class FormElement(FormElement):
             action = '/'
         self.browser._open(action, method=method, data=values,
                           content_type=self.get('enctype'))
+        if wait_for:
+            self.browser.wait_for(wait_for, timeout)
 
 
 class InputElement(InputElement):
@@ -360,7 +469,8 @@ class ButtonElement(object):
         name = self.attrib.get('name', False)
         if name:
             pairs.append((name, self.attrib.get('value', '')))
-        return element.submit(_extra_values=pairs)
+        return element.submit(wait_for=wait_for, timeout=timeout,
+                              _extra_values=pairs)
 
 
 class LinkElement(object):
@@ -373,6 +483,41 @@ class LinkElement(object):
             pass
         else:
             self.browser._open(link, 'GET')
+            if wait_for:
+                self.browser.wait_for(wait_for, timeout)
+
+
+class _Snapshot(object):
+    """WSGI browser state captured by :meth:`WSGI.snapshot`."""
+
+    __slots__ = ('cookie_jar', 'referrer', 'request_environ', 'status_code',
+                 'status', 'headers', 'response', 'document')
+
+    def __init__(self, browser):
+        self.cookie_jar = browser._cookie_jar.copy()
+        self.referrer = browser._referrer
+        self.request_environ = copy.copy(browser._request_environ)
+        self.status_code = browser.status_code
+        self.status = browser.status
+        self.headers = copy.copy(browser.headers)
+        self.response = browser.response
+        # only carry a parsed document if one has been parsed already
+        document = browser.__dict__.get('document')
+        if document is not None:
+            document = copy.deepcopy(document)
+        self.document = document
+
+    def apply(self, browser):
+        browser._cookie_jar = self.cookie_jar.copy()
+        browser._referrer = self.referrer
+        browser._request_environ = copy.copy(self.request_environ)
+        browser.status_code = self.status_code
+        browser.status = self.status
+        browser.headers = copy.copy(self.headers)
+        browser.response = self.response
+        browser._sync_document()
+        if self.document is not None:
+            browser.__dict__['document'] = copy.deepcopy(self.document)
 
 
 wsgi_elements = {
@@ -396,6 +541,11 @@ class CookieJar(cookielib.CookieJar):
         self._cookies = {}
         self._cookies_lock = dummy_threading.RLock()
 
+    def copy(self):
+        fork = copy.copy(self)
+        fork._cookies = copy.deepcopy(self._cookies)
+        return fork
+
     def export_to_environ(self, environ):
         if len(self):
             u_request = _WSGI_urllib2_request(environ)
@@ -0,0 +1,203 @@
+# Copyright Action Without Borders, Inc., the Alfajor authors and contributors.
+# All rights reserved.  See AUTHORS.
+#
+# This file is part of 'Alfajor' and is distributed under the BSD license.
+# See LICENSE for more details.
+
+"""Record HTTP exchanges to an archive and serve them back as a WSGI app.
+
+An archive is a pair of files: ``<path>.data`` holds the response bodies
+back to back and ``<path>.index`` holds one JSON line per exchange with the
+request method, URL and the response status, headers and body offset.
+
+Assign a :class:`Recorder` to the ``recorder`` attribute of a WSGI or
+network browser or of an APIClient to record, and serve an archive with
+the ``replay`` browser backend or an :class:`ArchiveApp`.
+
+"""
+
+from cgi import parse_qsl
+from hashlib import sha1
+import mmap
+import os
+from urlparse import urlsplit
+from wsgiref.util import request_uri
+
+from alfajor.utilities import to_pairs
+from alfajor._compat import json_dumps, json_loads
+
+
+__all__ = ['Archive', 'ArchiveApp', 'Recorder']
+
+
+class Recorder(object):
+    """Appends exchanges to the archive at *path*."""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._data = open(path + '.data', 'ab')
+        self._index = open(path + '.index', 'a')
+
+    def record(self, method, url, request_body, content_type,
+               status, headers, body):
+        """Append one request/response exchange to the archive."""
+        if body is None:
+            body = ''
+        elif isinstance(body, unicode):
+            body = body.encode('utf-8')
+        self._data.seek(0, 2)
+        offset = self._data.tell()
+        self._data.write(body)
+        self._data.flush()
+        entry = {
+            'key': request_key(method, url, content_type, request_body),
+            'method': method,
+            'url': url,
+            'status': status,
+            'headers': list(to_pairs(headers)),
+            'offset': offset,
+            'length': len(body),
+            }
+        self._index.write(json_dumps(entry) + '\n')
+        self._index.flush()
+
+    def close(self):
+        self._data.close()
+        self._index.close()
+
+
+class Archive(object):
+    """A read-only view of a recorded archive.
+
+    Bodies are read from a memory map of the data file.  When a request was
+    recorded more than once, successive lookups return the recordings in
+    order and then keep returning the last one.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = {}
+        self._cursors = {}
+        fh = open(path + '.index')
+        try:
+            for line in fh:
+                if line.strip():
+                    entry = json_loads(line)
+                    self._entries.setdefault(entry['key'], []).append(entry)
+        finally:
+            fh.close()
+        self._file = open(path + '.data', 'rb')
+        if os.fstat(self._file.fileno()).st_size:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        else:
+            self._map = ''
+
+    def lookup(self, method, url, content_type=None, request_body=''):
+        """Return (status, headers, body, url) recorded for a request.
+
+        Returns None if the request is not in the archive.
+
+        """
+        key = request_key(method, url, content_type, request_body)
+        entries = self._entries.get(key)
+        if not entries:
+            return None
+        position = self._cursors.get(key, 0)
+        self._cursors[key] = min(position + 1, len(entries) - 1)
+        entry = entries[position]
+        offset = entry['offset']
+        body = self._map[offset:offset + entry['length']]
+        headers = [(str(name), str(value)) for name, value in entry['headers']]
+        return str(entry['status']), headers, body, entry['url']
+
+    def rewind(self):
+        """Serve repeated recordings from the first one again."""
+        self._cursors.clear()
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._entries.itervalues())
+
+    def close(self):
+        if self._map:
+            self._map.close()
+        self._file.close()
+
+
+class ArchiveApp(object):
+    """A WSGI application answering requests from an :class:`Archive`.
+
+    Requests missing from the archive get a 404.
+
+    """
+
+    def __init__(self, archive):
+        if isinstance(archive, basestring):
+            archive = Archive(archive)
+        self.archive = archive
+
+    def __call__(self, environ, start_response):
+        found = self.archive.lookup(environ['REQUEST_METHOD'],
+                                    request_uri(environ),
+                                    environ.get('CONTENT_TYPE'),
+                                    request_body(environ))
+        if found is None:
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return ['Not in archive: %s %s' % (environ['REQUEST_METHOD'],
+                                               request_uri(environ))]
+        status, headers, body, recorded_url = found
+        # point absolute redirects at the recorded host to this one
+        recorded_host = _host_url(recorded_url)
+        host = _host_url(request_uri(environ))
+        if recorded_host != host:
+            for i, (key, value) in enumerate(headers):
+                if (key.lower() == 'location' and
+                    value.startswith(recorded_host)):
+                    headers[i] = (key, host + value[len(recorded_host):])
+        start_response(status, headers)
+        return [body]
+
+
+def request_key(method, url, content_type=None, body=''):
+    """The archive key of a request.
+
+    Requests are matched on method and path + query, so recordings replay
+    under any host.  URL-encoded form bodies are part of the key; other
+    bodies (e.g. multipart, with its random boundaries) are not.
+
+    """
+    scheme, netloc, path, query, fragment = urlsplit(url)
+    key = '%s %s' % (method.upper(), path or '/')
+    if query:
+        key += '?' + query
+    if body and (content_type or '').startswith(
+        'application/x-www-form-urlencoded'):
+        pairs = sorted(parse_qsl(body, True))
+        key += ' ' + sha1(repr(pairs)).hexdigest()
+    return key
+
+
+def _host_url(url):
+    scheme, netloc = urlsplit(url)[:2]
+    return '%s://%s' % (scheme, netloc)
+
+
+def request_body(environ):
+    """Read the request body from *environ* without consuming it."""
+    stream = environ.get('wsgi.input')
+    if stream is None:
+        return ''
+    try:
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    if not length or not hasattr(stream, 'seek'):
+        return ''
+    position = stream.tell()
+    body = stream.read(length)
+    stream.seek(position)
+    return body
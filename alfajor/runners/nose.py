@@ -11,10 +11,13 @@ from base64 import b64decode
 from logging import getLogger
 from optparse import OptionGroup
 from os import path
+from time import time
 
 from nose.plugins.base import Plugin
 
+from alfajor._compat import json_dumps
 from alfajor._management import ManagerLookupError, new_manager
+from alfajor.utilities import RequestProfiler
 
 
 logger = getLogger('nose.plugins')
@@ -29,6 +32,8 @@ class Alfajor(Plugin):
     def __init__(self):
         Plugin.__init__(self)
         self._contexts = []
+        self._profile = None
+        self._request_profiler = None
 
     def options(self, parser, env):
         group = OptionGroup(parser, "Alfajor options")
@@ -73,6 +78,52 @@ class Alfajor(Plugin):
                          '[ALFAJOR_SERVER_URL]')
         parser.add_option_group(group)
 
+        group = OptionGroup(parser, "Alfajor Network backend options")
+        group.add_option('--server-pool-size',
+                         dest='alfajor_server_pool_size',
+                         metavar='SERVER_POOL_SIZE',
+                         default=env.get('ALFAJOR_SERVER_POOL_SIZE', None),
+                         help='Start this many server processes on '
+                         'ephemeral ports and spread browsers across them. '
+                         '[ALFAJOR_SERVER_POOL_SIZE]')
+        parser.add_option_group(group)
+
+        group = OptionGroup(parser, "Alfajor Profiling Options")
+        group.add_option(
+            "--alfajor-profile", action="store_true",
+            dest="alfajor_profile",
+            default=env.get('ALFAJOR_PROFILE', False),
+            help="Report counts and durations of browser work per test "
+            "and per context [ALFAJOR_PROFILE]")
+        group.add_option(
+            "--alfajor-profile-file",
+            dest="alfajor_profile_file",
+            default=env.get('ALFAJOR_PROFILE_FILE'),
+            help="Also write the profile as JSON to this file; by default "
+            "it is only reported as text [ALFAJOR_PROFILE_FILE]")
+        group.add_option(
+            "--alfajor-profile-requests",
+            dest="alfajor_profile_requests",
+            metavar="PATTERN",
+            default=env.get('ALFAJOR_PROFILE_REQUESTS'),
+            help="cProfile in-process requests whose URL matches the "
+            "regular expression PATTERN ('.' for all) "
+            "[ALFAJOR_PROFILE_REQUESTS]")
+        group.add_option(
+            "--alfajor-profile-requests-rate",
+            dest="alfajor_profile_requests_rate",
+            type="float",
+            default=env.get('ALFAJOR_PROFILE_REQUESTS_RATE', 1.0),
+            help="Profile only this fraction of the matching requests "
+            "[ALFAJOR_PROFILE_REQUESTS_RATE]")
+        group.add_option(
+            "--alfajor-profile-requests-dir",
+            dest="alfajor_profile_requests_dir",
+            default=env.get('ALFAJOR_PROFILE_REQUESTS_DIR', 'alfajor-pstats'),
+            help="Write .pstats files named by test and URL to this "
+            "directory [ALFAJOR_PROFILE_REQUESTS_DIR]")
+        parser.add_option_group(group)
+
         group = OptionGroup(parser, "Alfajor Screenshot Options")
         group.add_option(
             "--screenshot", action="store_true",
@@ -84,6 +135,12 @@ class Alfajor(Plugin):
             dest="alfajor_screenshot_dir",
             default=env.get('ALFAJOR_SCREENSHOT_DIR', ''),
             help="Dir to store screenshots")
+        group.add_option(
+            "--history-dir",
+            dest="alfajor_history_dir",
+            default=env.get('ALFAJOR_HISTORY_DIR', ''),
+            help="Write the pages in browser history to this dir when a "
+            "test fails (requires history-size in alfajor.ini)")
         parser.add_option_group(group)
 
     def configure(self, options, config):
@@ -94,6 +151,13 @@ class Alfajor(Plugin):
                 short = key[len('alfajor_'):]
                 alfajor_options[short] = value
         self.options = alfajor_options
+        if alfajor_options.get('profile'):
+            self._profile = _Profile()
+        if alfajor_options.get('profile_requests'):
+            self._request_profiler = RequestProfiler(
+                alfajor_options['profile_requests_dir'],
+                alfajor_options['profile_requests'],
+                alfajor_options['profile_requests_rate'])
 
     def startContext(self, context):
         try:
@@ -119,7 +183,13 @@ class Alfajor(Plugin):
                             declaration.tool, context, exc.args[0])
                 continue
             managers.add((manager, declaration))
-            declaration.proxy._factory = manager.create
+            if self._profile is None:
+                factory = manager.create
+            else:
+                factory = self._profile.timed_create(context, manager)
+            if self._request_profiler is not None:
+                factory = _profiling(factory, self._request_profiler)
+            declaration.proxy._factory = factory
         if managers:
             self._contexts.append((context, managers))
 
@@ -128,15 +198,77 @@ class Alfajor(Plugin):
         if self._contexts and context == self._contexts[-1][0]:
             key, managers = self._contexts.pop(-1)
             for manager, declaration in managers:
-                manager.destroy()
+                if self._profile is None:
+                    manager.destroy()
+                else:
+                    self._profile.timed_destroy(context, manager)
                 declaration.proxy._instance = None
                 declaration.proxy._factory = None
 
+    def startTest(self, test):
+        if self._request_profiler is not None:
+            self._request_profiler.label = test.id()
+        if self._profile is not None:
+            self._profile.start_test(self._browsers())
+
+    def stopTest(self, test):
+        if self._profile is not None and self._profile.running:
+            context = self._contexts and self._contexts[-1][0] or None
+            self._profile.stop_test(test.id(), context, self._browsers())
+
+    def report(self, stream):
+        if self._profile is None:
+            return
+        stream.write(self._profile.as_text())
+        filename = self.options.get('profile_file')
+        if filename:
+            output_file = open(filename, 'w')
+            try:
+                output_file.write(json_dumps(self._profile.as_dict(),
+                                             indent=2, sort_keys=True))
+            finally:
+                output_file.close()
+
+    def _browsers(self):
+        """All browser instances created in the active contexts."""
+        browsers = []
+        for context, managers in self._contexts:
+            for manager, declaration in managers:
+                instance = declaration.proxy._instance
+                if instance is not None and hasattr(instance, 'stats'):
+                    browsers.append(instance)
+        return browsers
+
     def addError(self, test, err):
         self.screenshotIfEnabled(test)
+        self.historyIfEnabled(test)
 
     def addFailure(self, test, err):
         self.screenshotIfEnabled(test)
+        self.historyIfEnabled(test)
+
+    def historyIfEnabled(self, test):
+        """Dump the history of each browser to its own subdirectory.
+
+        Browsers are written to ``<history-dir>/<test>/<configuration>``,
+        numbered when several share a configuration.
+
+        """
+        directory = self.options.get('history_dir')
+        if not directory:
+            return
+        test_name = test.id().split('.')[-1]
+        seen = {}
+        for context, managers in self._contexts:
+            for manager, declaration in managers:
+                browser = declaration.proxy._instance
+                if getattr(browser, 'history', None) is None:
+                    continue
+                name = declaration.configuration
+                seen[name] = n = seen.get(name, 0) + 1
+                if n > 1:
+                    name = '%s-%s' % (name, n)
+                browser.history.dump(path.join(directory, test_name, name))
 
     def screenshotIfEnabled(self, test):
         if self.options['enabled_screenshot']:
@@ -165,3 +297,133 @@ class Alfajor(Plugin):
                 [path.abspath(directory), test_name + '.png']), "w")
         output_file.write(b64decode(img))
         output_file.close()
+
+
+class _Profile(object):
+    """Counts and durations of browser work, per test and per context.
+
+    Browser work is read from each browser's
+    :class:`~alfajor.browsers._timing.BrowserStats` before and after every
+    test.  Every metric is a ``[count, seconds]`` pair.
+
+    """
+
+    def __init__(self):
+        self.tests = {}
+        self.contexts = {}
+        self.running = False
+        self._baseline = None
+        self._started = None
+        self._servers = set()
+
+    def timed_create(self, context, manager):
+        """Wrap *manager*'s create() to record its cost against *context*."""
+        def create():
+            started = time()
+            instance = manager.create()
+            self._add(self.contexts, _name(context), 'create', 1,
+                      time() - started)
+            for process in _server_processes(manager):
+                if id(process) not in self._servers:
+                    self._servers.add(id(process))
+                    self._add(self.contexts, _name(context), 'server-startup',
+                              1, process.startup_time or 0.0)
+            return instance
+        return create
+
+    def timed_destroy(self, context, manager):
+        started = time()
+        manager.destroy()
+        self._add(self.contexts, _name(context), 'destroy', 1,
+                  time() - started)
+
+    def start_test(self, browsers):
+        self._baseline = _browser_totals(browsers)
+        self._started = time()
+        self.running = True
+
+    def stop_test(self, test_id, context, browsers):
+        elapsed = time() - self._started
+        self.running = False
+        totals = _browser_totals(browsers)
+        for metric, (count, seconds) in totals.iteritems():
+            before = self._baseline.get(metric, (0, 0.0))
+            count, seconds = count - before[0], seconds - before[1]
+            if count or seconds:
+                self._add(self.tests, test_id, metric, count, seconds)
+                if context is not None:
+                    self._add(self.contexts, _name(context), metric,
+                              count, seconds)
+        self._add(self.tests, test_id, 'test', 1, elapsed)
+        if context is not None:
+            self._add(self.contexts, _name(context), 'test', 1, elapsed)
+
+    def as_dict(self):
+        return {'contexts': self.contexts, 'tests': self.tests}
+
+    def as_text(self):
+        lines = ['', 'Alfajor profile', '-' * 70]
+        for title, scope in (('Contexts', self.contexts),
+                             ('Tests', self.tests)):
+            lines.append(title + ':')
+            for name, metrics in _by_cost(scope):
+                lines.append('  %-54s %9.4fsec' % (name, _cost(metrics)))
+                for metric, (count, seconds) in sorted(
+                    metrics.items(), key=lambda item: -item[1][1]):
+                    lines.append('    %-40s %6d %9.4fsec' % (
+                        metric, count, seconds))
+        lines.append('')
+        return '\n'.join(lines)
+
+    def _add(self, scope, name, metric, count, seconds):
+        metrics = scope.setdefault(name, {})
+        totals = metrics.setdefault(metric, [0, 0.0])
+        totals[0] += count
+        totals[1] += seconds
+
+
+def _profiling(factory, profiler):
+    """Wrap *factory* to give in-process instances a request *profiler*."""
+    def create():
+        instance = factory()
+        if hasattr(instance, 'profiler'):
+            instance.profiler = profiler
+        return instance
+    return create
+
+
+def _name(context):
+    return getattr(context, '__name__', None) or repr(context)
+
+
+def _cost(metrics):
+    return sum(metrics.get(metric, (0, 0.0))[1]
+               for metric in ('create', 'destroy', 'test'))
+
+
+def _by_cost(scope):
+    return sorted(scope.items(), key=lambda item: -_cost(item[1]))
+
+
+def _browser_totals(browsers):
+    """Sum the operation and phase totals of *browsers*."""
+    totals = {}
+    for browser in browsers:
+        stats = browser.stats
+        for source in stats.operations, stats.phases:
+            for metric, (count, seconds) in source.iteritems():
+                entry = totals.setdefault(metric, [0, 0.0])
+                entry[0] += count
+                entry[1] += seconds
+    return totals
+
+
+def _server_processes(manager):
+    """The server subprocesses a browser manager has started."""
+    processes = []
+    if getattr(manager, 'process', None) is not None:
+        processes.append(manager.process)
+    pool = getattr(manager, 'pool', None)
+    if pool is not None:
+        processes.extend(process for url, process in pool.servers)
+    return processes
@@ -7,10 +7,20 @@
 """Utilities useful for managing functional browsers and HTTP clients."""
 
 import inspect
+import os
+import random
+import re
+from string import Template
 import sys
 import time
 
-__all__ = ['ServerSubProcess', 'eval_dotted_path', 'invoke']
+__all__ = [
+    'RequestProfiler',
+    'ServerPool',
+    'ServerSubProcess',
+    'eval_dotted_path',
+    'invoke',
+    ]
 
 
 def _import(module_name):
@@ -161,6 +171,8 @@ class ServerSubProcess(object):
     def __init__(self, cmd, ping=None):
         self.cmd = cmd
         self.process = None
+        #: Seconds the last :meth:`start` took to bring the server up.
+        self.startup_time = None
         if not ping:
             self.host = self.port = None
         else:
@@ -186,6 +198,7 @@ class ServerSubProcess(object):
             cmd = shlex.split(self.cmd)
         else:
             cmd = self.cmd
+        start = time.time()
         process = Popen(cmd, stdout=PIPE, stderr=STDOUT, close_fds=True)
 
         if not self.host:
@@ -194,9 +207,9 @@ class ServerSubProcess(object):
                 output = process.communicate()[0]
                 raise RuntimeError("Did not start server!  Woe!\n" + output)
             self.process = process
+            self.startup_time = time.time() - start
             return
 
-        start = time.time()
         while process.poll() is None and time.time() - start < 15:
             if self.network_ping():
                 break
@@ -204,6 +217,7 @@ class ServerSubProcess(object):
             output = process.communicate()[0]
             raise RuntimeError("Did not start server!  Woe!\n" + output)
         self.process = process
+        self.startup_time = time.time() - start
 
     def stop(self):
         """Stop the process."""
@@ -240,3 +254,156 @@ class ServerSubProcess(object):
             return True
         finally:
             del sock
+
+
+class ServerPool(object):
+    """Starts and stops a pool of identical server subprocesses.
+
+    Each server is started on its own ephemeral port.  The string ``$port``
+    in *cmd*, *url* and *ping* is replaced with that port number, e.g.::
+
+      pool = ServerPool('alfajor-invoke tests.browser.webapp:run --port=$port',
+                        'http://localhost:$port', 4, 'localhost:$port')
+
+    """
+
+    def __init__(self, cmd, url, size, ping=None):
+        self.cmd = cmd
+        self.url = url
+        self.size = int(size)
+        self.ping = ping
+        self._slots = {}
+        self._next = 0
+
+    @property
+    def servers(self):
+        """(url, process) pairs of the running servers, in slot order."""
+        return [self._slots[index] for index in sorted(self._slots)]
+
+    @property
+    def urls(self):
+        """The base URLs of the running servers, in slot order."""
+        return [url for url, process in self.servers]
+
+    def start(self):
+        """Start all servers in the pool."""
+        if self._slots:
+            raise RuntimeError("Pool already started.")
+        try:
+            for index in xrange(self.size):
+                self._start(index)
+        except:
+            self.stop()
+            raise
+
+    def stop(self):
+        """Stop all servers in the pool."""
+        slots, self._slots = self._slots, {}
+        for url, process in slots.values():
+            process.stop()
+
+    def next_url(self):
+        """Return server URLs in round-robin order."""
+        servers = self.servers
+        if not servers:
+            raise RuntimeError("Pool is not started.")
+        url = servers[self._next % len(servers)][0]
+        self._next += 1
+        return url
+
+    def url_for(self, index):
+        """Return the URL of server *index* (modulo the pool size).
+
+        Only that server is started if it is not running yet, so e.g. each
+        test worker process can boot just the server it will use.
+
+        """
+        index = index % self.size
+        if index not in self._slots:
+            self._start(index)
+        return self._slots[index][0]
+
+    def _start(self, index):
+        port = free_port()
+        process = ServerSubProcess(_substitute_port(self.cmd, port),
+                                   _substitute_port(self.ping, port))
+        process.start()
+        self._slots[index] = (_substitute_port(self.url, port), process)
+
+
+def free_port(host='localhost'):
+    """Return a TCP port number on *host* that is currently unused."""
+    import socket
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+    finally:
+        sock.close()
+
+
+def _substitute_port(value, port):
+    """Replace ``$port`` in *value*, a string or sequence of strings."""
+    if value is None:
+        return None
+    if isinstance(value, basestring):
+        return Template(value).safe_substitute(port=port)
+    return [_substitute_port(part, port) for part in value]
+
+
+class RequestProfiler(object):
+    """Profiles selected in-process requests with cProfile.
+
+    Requests whose URL matches the regular expression *pattern* (or all
+    requests, if no pattern is given) are sampled at *rate*, a fraction
+    between 0 and 1.  The profile of each sampled request is written to
+    *directory* as a ``.pstats`` file named after :attr:`label` (e.g. the
+    running test) and the URL.  Assign an instance to the ``profiler``
+    attribute of a WSGI browser or an APIClient to enable it::
+
+      browser.profiler = RequestProfiler('pstats', pattern='/search')
+
+    """
+
+    def __init__(self, directory, pattern=None, rate=1.0):
+        self.directory = directory
+        if isinstance(pattern, basestring):
+            pattern = re.compile(pattern)
+        self.pattern = pattern
+        self.rate = float(rate)
+        #: Prefixes written file names; the nose plugin sets the test id.
+        self.label = None
+        #: Paths of the .pstats files written so far.
+        self.written = []
+
+    def wants(self, url):
+        """True if the request for *url* should be profiled."""
+        if self.pattern is not None and not self.pattern.search(url):
+            return False
+        return self.rate >= 1.0 or random.random() < self.rate
+
+    def call(self, url, fn, *args, **kw):
+        """Run ``fn(*args, **kw)`` under the profiler, saving its stats."""
+        import cProfile
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(fn, *args, **kw)
+        finally:
+            self._dump(profile, url)
+
+    def _dump(self, profile, url):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        stem = os.path.join(self.directory, '%s.%s' % (
+            _slug(self.label or 'request'), _slug(url)[:100]))
+        filename, n = stem + '.pstats', 1
+        while os.path.exists(filename):
+            n += 1
+            filename = '%s-%s.pstats' % (stem, n)
+        profile.dump_stats(filename)
+        self.written.append(filename)
+
+
+def _slug(value):
+    """Make *value* safe for use in a file name."""
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', value).strip('_') or '_'
@@ -0,0 +1,125 @@
+# Copyright Action Without Borders, Inc., the Alfajor authors and contributors.
+# All rights reserved.  See AUTHORS.
+#
+# This file is part of 'alfajor' and is distributed under the BSD license.
+# See LICENSE for more details.
+
+"""Benchmarks for Alfajor.
+
+Each benchmark module has a ``main`` function that can be run with
+alfajor-invoke, e.g.::
+
+  alfajor-invoke benchmarks.browsers --repeat=500 --output=after.json \
+      --compare=before.json
+
+Results are printed and, with ``--output``, saved as JSON for comparison
+with a later run via ``--compare``.
+
+"""
+
+import platform
+import sys
+import time
+from timeit import default_timer
+
+import alfajor
+from alfajor._compat import json_dumps, json_loads
+
+
+def percentile(timings, fraction):
+    """The nearest-rank percentile of sorted *timings*."""
+    if not timings:
+        return 0.0
+    rank = int(round(fraction * len(timings) + 0.5)) - 1
+    return timings[max(0, min(rank, len(timings) - 1))]
+
+
+def measure(fn, repeat=100, warmup=5):
+    """Call *fn* *repeat* times and summarize the per-call timings."""
+    for i in xrange(warmup):
+        fn()
+    timings = []
+    for i in xrange(repeat):
+        started = default_timer()
+        fn()
+        timings.append(default_timer() - started)
+    timings.sort()
+    total = sum(timings)
+    return {
+        'n': repeat,
+        'ops_per_sec': total and repeat / total or 0.0,
+        'mean': total / repeat,
+        'min': timings[0],
+        'p50': percentile(timings, 0.50),
+        'p90': percentile(timings, 0.90),
+        'p99': percentile(timings, 0.99),
+        'max': timings[-1],
+        }
+
+
+class Suite(object):
+    """Runs and reports a set of named benchmarks.
+
+    :param repeat: default number of timed calls per benchmark
+    :param only: if given, run only benchmarks whose name contains it
+    :param stream: where progress is printed
+
+    """
+
+    def __init__(self, repeat=100, only=None, stream=None):
+        self.repeat = int(repeat)
+        self.only = only
+        self.stream = stream or sys.stdout
+        self.results = {}
+
+    def add(self, name, fn, repeat=None, **extra):
+        """Measure *fn* as benchmark *name*.
+
+        Keyword arguments are saved with the result, e.g. the document size
+        a scaling benchmark ran against.
+
+        """
+        if self.only and self.only not in name:
+            return None
+        result = measure(fn, repeat or self.repeat)
+        result.update(extra)
+        self.results[name] = result
+        print >> self.stream, _format(name, result)
+        return result
+
+    def finish(self, output=None, compare=None):
+        """Save results to *output* and compare them with *compare*."""
+        report = {
+            'alfajor': alfajor.__version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.time(),
+            'results': self.results,
+            }
+        if output:
+            fh = open(output, 'w')
+            try:
+                fh.write(json_dumps(report, indent=2, sort_keys=True))
+            finally:
+                fh.close()
+        if compare:
+            fh = open(compare)
+            try:
+                baseline = json_loads(fh.read())['results']
+            finally:
+                fh.close()
+            print >> self.stream
+            print >> self.stream, 'Compared with %s (ops/sec ratio):' % (
+                compare)
+            for name in sorted(self.results):
+                if name in baseline and baseline[name]['ops_per_sec']:
+                    ratio = (self.results[name]['ops_per_sec'] /
+                             baseline[name]['ops_per_sec'])
+                    print >> self.stream, '  %-40s %6.2fx' % (name, ratio)
+        return 0
+
+
+def _format(name, result):
+    return '%-40s %10.1f ops/sec  p50 %8.3fms  p90 %8.3fms  p99 %8.3fms' % (
+        name, result['ops_per_sec'], result['p50'] * 1000,
+        result['p90'] * 1000, result['p99'] * 1000)
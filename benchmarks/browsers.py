@@ -0,0 +1,89 @@
+# Copyright Action Without Borders, Inc., the Alfajor authors and contributors.
+# All rights reserved.  See AUTHORS.
+#
+# This file is part of 'alfajor' and is distributed under the BSD license.
+# See LICENSE for more details.
+
+"""Throughput and latency of the browser backends and the APIClient.
+
+Runs offline against the self-test web application::
+
+  alfajor-invoke benchmarks.browsers [--repeat=N] [--only=wsgi]
+      [--output=FILE] [--compare=FILE] [--no-network]
+
+"""
+
+from werkzeug import Request, Response
+
+from alfajor.apiclient import APIClient
+from alfajor.browsers.network import Network
+from alfajor.browsers.wsgi import WSGI
+from alfajor.utilities import ServerSubProcess, free_port
+from alfajor._compat import json_dumps
+
+from benchmarks import Suite
+from tests.browser.webapp import webapp
+
+
+def main(repeat=200, only=None, output=None, compare=None, network=True):
+    suite = Suite(repeat, only)
+
+    browser = WSGI(webapp(), 'http://localhost')
+    run_browser(suite, 'wsgi', browser)
+
+    run_apiclient(suite)
+
+    if network:
+        port = free_port()
+        server = ServerSubProcess(
+            'alfajor-invoke tests.browser.webapp:run --port=%s' % port,
+            'localhost:%s' % port)
+        server.start()
+        try:
+            browser = Network('http://localhost:%s' % port)
+            run_browser(suite, 'network', browser)
+        finally:
+            server.stop()
+
+    return suite.finish(output, compare)
+
+
+def run_browser(suite, prefix, browser):
+    """Benchmark the common operations of *browser*."""
+    suite.add(prefix + '.open', lambda: browser.open('/'))
+
+    def fill_and_submit():
+        browser.open('/form/fill')
+        form = browser.document.forms[1]
+        form.fill({'xx_a': 'benchmark', 'xx_boxes': ['1', '3']})
+        form.submit()
+    suite.add(prefix + '.fill_submit', fill_and_submit)
+
+    browser.open('/dom')
+    document = browser.document
+    suite.add(prefix + '.css_lookup', lambda: document['#C li'])
+    suite.add(prefix + '.text_content_contains', lambda: 'msg 4' in browser)
+
+
+def run_apiclient(suite):
+    """Benchmark APIClient requests that carry a session cookie."""
+    login = APIClient(cookie_app).post('/login', data={'user': 'benchmark'})
+    client = login.client
+    assert client.get('/').json['user'] == 'benchmark'
+
+    suite.add('apiclient.get_cookies', lambda: client.get('/'))
+    suite.add('apiclient.post_cookies',
+              lambda: client.post('/login', data={'user': 'benchmark'}))
+
+
+def cookie_app(environ, start_response):
+    """Echo the session cookie as JSON; POSTs set it."""
+    request = Request(environ)
+    user = request.cookies.get('session')
+    if request.method == 'POST':
+        user = request.form.get('user')
+    response = Response(json_dumps({'user': user}),
+                        mimetype='application/json')
+    if request.method == 'POST':
+        response.set_cookie('session', user)
+    return response(environ, start_response)
@@ -0,0 +1,98 @@
+# Copyright Action Without Borders, Inc., the Alfajor authors and contributors.
+# All rights reserved.  See AUTHORS.
+#
+# This file is part of 'alfajor' and is distributed under the BSD license.
+# See LICENSE for more details.
+
+"""Synthetic pages for exercising the DOM layer at production sizes.
+
+Each generator returns a complete HTML page whose size grows with *n*.
+:func:`document_app` serves them as ``/<kind>?n=<size>`` so that they can
+be opened in any in-process browser.
+
+"""
+
+from werkzeug import Request, Response
+
+
+def deep_nesting(n, max_depth=200):
+    """*n* nested ``<div>`` elements, each holding a little text.
+
+    Nesting is capped at *max_depth*, below libxml2's parser depth limit;
+    beyond that the page holds several sibling chains.
+
+    """
+    chains = []
+    for start in xrange(0, n, max_depth):
+        depth = min(max_depth, n - start)
+        opening = ''.join('<div id="d%s" class="level">level %s ' % (i, i)
+                          for i in xrange(start, start + depth))
+        chains.append('%s<span class="leaf">leaf</span>%s' % (
+            opening, '</div>' * depth))
+    return _page('<div id="root">%s</div>' % ''.join(chains))
+
+
+def wide_table(n, columns=10):
+    """A table of *n* rows of *columns* cells."""
+    rows = []
+    for row in xrange(n):
+        cells = ''.join('<td class="c%s">r%sc%s</td>' % (col, row, col)
+                        for col in xrange(columns))
+        rows.append('<tr id="r%s">%s</tr>' % (row, cells))
+    return _page('<table id="table">%s</table>' % ''.join(rows))
+
+
+def big_form(n):
+    """A form with *n* controls of mixed types."""
+    controls = []
+    for i in xrange(n):
+        kind = i % 4
+        if kind == 0:
+            controls.append('<input type="text" name="text%s" value="v%s">'
+                            % (i, i))
+        elif kind == 1:
+            controls.append('<input type="checkbox" name="box%s" value="on"'
+                            '%s>' % (i, i % 8 == 1 and ' checked' or ''))
+        elif kind == 2:
+            controls.append('<textarea name="area%s">text %s</textarea>'
+                            % (i, i))
+        else:
+            controls.append(
+                '<select name="select%s"><option>a</option>'
+                '<option selected>b</option><option>c</option></select>' % i)
+    return _page('<form id="form" method="POST" action="/form">%s'
+                 '<input type="submit" name="go" value="Go"></form>'
+                 % ''.join(controls))
+
+
+def big_select(n, multiple=False):
+    """A form holding one ``<select>`` with *n* options."""
+    options = ''.join('<option value="o%s">Option %s</option>' % (i, i)
+                      for i in xrange(n))
+    return _page('<form id="form"><select id="select" name="select"%s>%s'
+                 '</select></form>' % (multiple and ' multiple' or '',
+                                       options))
+
+
+generators = {
+    'deep': deep_nesting,
+    'table': wide_table,
+    'form': big_form,
+    'select': big_select,
+    }
+
+
+def document_app(environ, start_response):
+    """Serve ``/<kind>?n=<size>`` from :data:`generators`."""
+    request = Request(environ)
+    kind = request.path.strip('/')
+    if kind == 'multiselect':
+        body = big_select(request.args.get('n', 10, type=int), True)
+    else:
+        body = generators[kind](request.args.get('n', 10, type=int))
+    return Response(body, mimetype='text/html')(environ, start_response)
+
+
+def _page(body):
+    return '<html><head><title>synthetic</title></head><body>%s</body></html>' % (
+        body)
@@ -0,0 +1,85 @@
+# Copyright Action Without Borders, Inc., the Alfajor authors and contributors.
+# All rights reserved.  See AUTHORS.
+#
+# This file is part of 'alfajor' and is distributed under the BSD license.
+# See LICENSE for more details.
+
+"""Scaling of the lxml DOM layer with document size.
+
+Runs each micro-benchmark against synthetic pages of increasing size and
+reports the growth exponent between sizes: about 1 for linear work, about
+2 for quadratic::
+
+  alfajor-invoke benchmarks.dom [--sizes=100,1000,5000] [--repeat=N]
+      [--only=form_values] [--output=FILE] [--compare=FILE]
+
+"""
+
+from math import log
+
+from alfajor.browsers.wsgi import WSGI
+
+from benchmarks import Suite
+from benchmarks.documents import document_app
+
+
+def main(sizes='100,1000,5000', repeat=50, only=None, output=None,
+         compare=None):
+    sizes = [int(size) for size in str(sizes).split(',')]
+    suite = Suite(repeat, only)
+    browser = WSGI(document_app, 'http://localhost')
+
+    for n in sizes:
+        # fewer repetitions for bigger documents, but always a few
+        times = max(3, int(repeat) * sizes[0] // n)
+
+        def add(name, fn):
+            suite.add('%s[%s]' % (name, n), fn, times, benchmark=name, size=n)
+
+        browser.open('/table?n=%s' % n)
+        document = browser.document
+        last = n - 1
+        add('getitem_id', lambda: document['#r%s' % last])
+        add('getitem_css', lambda: document['td.c3'])
+        add('text_content', lambda: document['#table'].text_content)
+        add('contains', lambda: 'r%sc9' % last in browser)
+
+        browser.open('/deep?n=%s' % n)
+        root = browser.document['#root']
+        add('innerHTML', lambda: root.innerHTML)
+
+        browser.open('/form?n=%s' % n)
+        form = browser.document.forms[0]
+        add('form_values', lambda: form.form_values())
+        add('fields_lookup', lambda: form.fields['text%s' % (last // 4 * 4)])
+        add('fill', lambda: form.fill({'text0': 'x', 'box1': True}))
+
+        browser.open('/select?n=%s' % n)
+        select = browser.document['#select']
+        add('select_value', lambda: setattr(select, 'value', 'o%s' % last))
+
+        browser.open('/multiselect?n=%s' % n)
+        select = browser.document['#select']
+        add('multiselect_add', lambda: select.value.add('o%s' % last))
+
+    report_scaling(suite)
+    return suite.finish(output, compare)
+
+
+def report_scaling(suite):
+    """Print each benchmark's mean time by size and its growth exponent."""
+    curves = {}
+    for result in suite.results.values():
+        curves.setdefault(result['benchmark'], []).append(
+            (result['size'], result['mean']))
+    print >> suite.stream
+    print >> suite.stream, 'Scaling (mean ms by size; growth exponent):'
+    for name in sorted(curves):
+        points = sorted(curves[name])
+        cells = ['%s: %.3f' % (size, mean * 1000) for size, mean in points]
+        exponents = []
+        for (n1, t1), (n2, t2) in zip(points, points[1:]):
+            if n2 != n1 and t1 > 0 and t2 > 0:
+                exponents.append('%.2f' % (log(t2 / t1) / log(float(n2) / n1)))
+        print >> suite.stream, '  %-18s %s  [%s]' % (
+            name, '  '.join(cells), ', '.join(exponents))
@@ -50,7 +50,8 @@ version = alfajor.__version__
 setup(name="alfajor",
       version=version,
       packages=find_packages(exclude=[
-          '*.tests', '*.tests.*', 'tests.*', 'tests']),
+          '*.tests', '*.tests.*', 'tests.*', 'tests',
+          'benchmarks.*', 'benchmarks']),
 
       author='Action Without Borders, Inc.',
       author_email='oss@idealist.org',
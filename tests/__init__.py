@@ -4,3 +4,26 @@
 # This file is part of 'alfajor' and is distributed under the BSD license.
 # See LICENSE for more details.
 
+
+from threading import Thread
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+
+class QuietHandler(WSGIRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(app):
+    """Serve *app* from a background thread on an ephemeral port.
+
+    Returns the server; its URL is ``http://127.0.0.1:<server_port>`` and
+    ``server.shutdown()`` stops it.
+
+    """
+    server = make_server('127.0.0.1', 0, app, handler_class=QuietHandler)
+    thread = Thread(target=server.serve_forever)
+    thread.setDaemon(True)
+    thread.start()
+    return server
@@ -5,9 +5,12 @@
 # See LICENSE for more details.
 import time
 
-from nose.tools import raises
+from nose.tools import assert_raises, raises
+
+from alfajor.browsers.wsgi import WSGI, after_browser_activity
 
 from . import browser, browser_test, screenshot_fails
+from .webapp import webapp
 
 
 @browser_test()
@@ -182,6 +185,37 @@ def test_wait_for_js():
             wait_for='js:window.exampleCount==100;', timeout=3000)
 
 
+@browser_test()
+def test_wait_expression_without_javascript():
+    if 'javascript' in browser.capabilities:
+        return
+    expr = browser.wait_expression
+    browser.open('/waitfor', wait_for=expr().element_present('#removeme'))
+    browser.wait_for(expr().element_not_present('#expected_p').
+                     ajax_complete())
+    browser.wait_for(expr().element_present('#expected_p').
+                     or_().
+                     element_present('#remover'))
+    browser.wait_for(expr().evaluate_element(
+        '#removeme', lambda el: 'wait_for' in el.text_content))
+    browser.wait_for(expr().element_present(browser.document['#remover']))
+    browser.wait_for('element:css=#removeme')
+    browser.wait_for('!element:id=expected_p')
+    browser.wait_for('js:window.exampleCount==100;')
+    browser.wait_for('element:link=wait_for_js')
+    browser.wait_for('!element:link=exact:wait_for_*')
+
+    assert_raises(ValueError, browser.wait_for,
+                  'element:dom=document.links[0]')
+    assert_raises(AssertionError, browser.wait_for,
+                  expr().element_present('#expected_p'), 300)
+    assert_raises(AssertionError, browser.wait_for,
+                  expr().ajax_pending().or_().element_present('#nope'), 300)
+    assert_raises(AssertionError, browser.open, '/waitfor',
+                  wait_for='element:css=#expected_p', timeout=300)
+    assert_raises(TypeError, expr().evaluate_element, '#removeme', 'true')
+
+
 @browser_test()
 def test_set_cookie():
     if 'cookies' in browser.capabilities:
@@ -203,3 +237,73 @@ def test_screenshot():
         return
     browser.open('http://www.google.com')
     assert False
+
+
+@browser_test()
+def test_snapshot():
+    if 'in-process' not in browser.capabilities:
+        return
+    browser.open('/assign-cookie/1')
+    browser.open('/form/fill')
+    form = browser.document.forms[1]
+    form.fill({'xx_a': 'logged in'})
+    snap = browser.snapshot()
+
+    browser.reset()
+    browser.open('/')
+    assert not browser.cookies
+    assert 'hi there' in browser
+
+    for attempt in 1, 2:
+        browser.restore(snap)
+        assert browser.cookies == {'cookie1': 'value1'}
+        assert browser.location.endswith('/form/fill')
+        assert browser.status_code == 200
+        form = browser.document.forms[1]
+        assert form.fields['xx_a'] == 'logged in'
+        # changes to a restored document do not leak into the snapshot
+        form.fill({'xx_a': 'changed'})
+
+    browser.document.forms[1].submit()
+    assert browser.cookies == {'cookie1': 'value1'}
+    assert 'changed' in browser.document['#data'].text
+
+
+@browser_test()
+def test_timing():
+    if 'selenium' in browser.capabilities:
+        return
+    timings = []
+
+    def collect(sender):
+        timings.append(sender.timing)
+    after_browser_activity.connect(collect)
+    try:
+        browser.stats.reset()
+        browser.open('/seq/c')
+    finally:
+        after_browser_activity.disconnect(collect)
+
+    assert timings
+    assert timings[0].finished and timings[0].counts['redirects'] == 1
+    assert timings[-1].url.endswith(('/seq/c', '/seq/d'))
+    assert browser.stats.operations['open'][0] == len(timings)
+    if 'in-process' in browser.capabilities:
+        assert timings[0].phases['app'] >= 0
+        assert 'parse' in timings[-1].phases
+    else:
+        assert timings[0].phases['body'] >= 0
+
+    assert browser.document is not None
+    assert browser.stats.phases['parse'][0] >= 1
+
+
+def test_keep_body():
+    wsgi = WSGI(webapp(), 'http://localhost', keep_body=False)
+    wsgi.open('/seq/c')
+    assert wsgi.response is None
+    assert wsgi.location.endswith('/seq/d')
+    assert wsgi.document['title'][0].text == 'seq/d'
+    wsgi.keep_body = True
+    wsgi.open('/')
+    assert 'hi there' in wsgi.response
@@ -4,6 +4,8 @@
 # This file is part of 'alfajor' and is distributed under the BSD license.
 # See LICENSE for more details.
 
+from alfajor.browsers._lxml import DocumentCache
+
 from . import browser
 
 
@@ -72,3 +74,58 @@ def test_visibility():
         assert not p.is_visible
     else:
         assert p.is_visible
+
+
+def test_visible_batch():
+    browser.open('/dom')
+    ps = browser.document['p']
+    if 'visibility' in browser.capabilities:
+        assert browser.visible(ps) == [True, True, False, True]
+    else:
+        assert browser.visible(ps) == [True, True, True, True]
+    assert browser.visible([]) == []
+
+
+def test_document_cache():
+    instance = browser._get_instance()
+    instance.document_cache = cache = DocumentCache(1)
+    try:
+        browser.open('/dom')
+        first = browser.document
+        first['#C'][0].text = 'changed'
+        assert (cache.hits, cache.misses) == (0, 1)
+
+        browser.open('/dom')
+        second = browser.document
+        assert (cache.hits, cache.misses) == (1, 1)
+        assert second is not first
+        assert second['#C'][0].text == '1'
+        assert second['#A'].fq_xpath == '/html/body/dl'
+
+        browser.open('/')
+        assert 'hi there' in browser
+        assert (cache.hits, cache.misses, len(cache)) == (1, 2, 1)
+        browser.open('/dom')
+        assert browser.document['#C'][0].text == '1'
+        assert (cache.hits, cache.misses) == (1, 3)
+    finally:
+        instance.document_cache = None
+
+
+def test_selenium_locators():
+    from alfajor.browsers.selenium import _shortest_locator
+
+    browser.open('/dom')
+    doc = browser.document
+    index = browser._document_index
+    assert _shortest_locator(doc['#A'], index) == 'id=A'
+    assert _shortest_locator(doc['#C li'][1], index) == \
+        "xpath=//*[@id='C']/li[2]"
+    assert _shortest_locator(doc['p'][0], index) == 'xpath=/html/body/p[1]'
+
+    browser.open('/form/fill')
+    form = browser.document.forms[1]
+    index = browser._document_index
+    assert _shortest_locator(form['input'][0], index) == 'name=xx_a'
+    box = form.inputs['xx_boxes'][2]
+    assert _shortest_locator(box, index) == 'xpath=' + box.fq_xpath
@@ -4,9 +4,12 @@
 # This file is part of 'alfajor' and is distributed under the BSD license.
 # See LICENSE for more details.
 
+import os
+import tempfile
+
 from alfajor._compat import json_loads as loads
 
-from nose.tools import eq_, raises
+from nose.tools import assert_raises, eq_, raises
 
 from . import browser
 
@@ -191,6 +194,35 @@ def test_multipart_simple():
     assert data == [['search', 'foobar']]
 
 
+def test_multipart_file():
+    if 'upload' not in browser.capabilities:
+        return
+
+    fh, path = tempfile.mkstemp(suffix='.txt')
+    os.write(fh, 'uploaded\n' * 1000)
+    os.close(fh)
+    try:
+        browser.open('/form/multipart')
+        form = browser.document.forms[1]
+        form['input[name=search]'][0].value = 'foobar'
+        form['input[name=file]'][0].value = path
+        form.submit(wait_for='page')
+        data = loads(browser.document['#data'].text_content)
+        assert data == [['search', 'foobar']]
+        files = loads(browser.document['#files'].text_content)
+        assert len(files) == 1
+        name, (filename, content_type, length, saved) = files[0]
+        try:
+            assert name == 'file'
+            assert filename == os.path.basename(path)
+            assert content_type == 'text/plain'
+            assert open(saved).read() == 'uploaded\n' * 1000
+        finally:
+            os.remove(saved)
+    finally:
+        os.remove(path)
+
+
 def test_formless_submit_button():
     browser.open('/form/submit')
     assert browser.document['#method'].text == 'GET'
@@ -207,6 +239,43 @@ def test_select_default_initial_empty():
     assert data == [['sel', '']]
 
 
+def test_form_values_document_order():
+    browser.open('/form/fill')
+    form = browser.document.forms[1]
+    form.fill([('xx_boxes', '3'), ('xx_b', 'b'), ('xx_boxes', '1'),
+               ('xx_a', 'a')])
+    eq_(form.form_values(), [('xx_a', 'a'), ('xx_b', 'b'),
+                             ('xx_boxes', '1'), ('xx_boxes', '3')])
+
+    browser.open('/form/select')
+    forms = browser.document.forms
+    eq_(forms[0].form_values(), [('sel', '')])
+    eq_(forms[1].form_values(), [('sel', '')])
+    # nothing is submitted for an unselected multiple select
+    eq_(forms[2].form_values(), [])
+    forms[2].fill({'multi_sel': ['third', 'first']})
+    eq_(forms[2].form_values(), [('multi_sel', 'first'),
+                                 ('multi_sel', 'third')])
+
+
+def test_inputs_index():
+    browser.open('/form/fill')
+    inputs = browser.document.forms[1].inputs
+    eq_(inputs.keys(), ['xx_a', 'xx_b', 'xx_boxes'])
+    assert 'xx_a' in inputs
+    assert 'xx_c' not in inputs
+    eq_([el.value for el in inputs['xx_boxes']], ['1', '2', '3'])
+    eq_([(name, len(els)) for name, els in inputs.iteritems()],
+        [('xx_a', 1), ('xx_b', 1), ('xx_boxes', 3)])
+    assert_raises(KeyError, inputs.__getitem__, 'xx_c')
+
+    fields = browser.document.forms[1].fields
+    fields['xx_a'] = 'a'
+    fields['xx_boxes'] = ['1', '2']
+    eq_(fields['xx_a'], 'a')
+    eq_(sorted(fields['xx_boxes']), ['1', '2'])
+
+
 def _test_select(form_num, fieldname, value, expected_return):
     """Repeat tests with multiple lxml <select> value setting strategies."""
 
@@ -260,6 +329,25 @@ def test_select_multiple_value_only_and_others():
                     ['second', 'Fourth option'])
 
 
+def test_select_multiple_add_remove():
+    browser.open('/form/select')
+    select = browser.document.forms[2]['select'][0]
+    selected = select.value
+    selected.add('second')
+    selected.add('Fourth option')
+    eq_(sorted(select.value), ['Fourth option', 'second'])
+
+    selected.remove('second')
+    assert_raises(ValueError, selected.remove, 'second')
+    assert_raises(ValueError, selected.remove, 'fifth')
+    assert_raises(ValueError, selected.add, 'fifth')
+    eq_(list(select.value), ['Fourth option'])
+
+    select.value = ['first', 'third']
+    eq_(list(select.value), ['first', 'third'])
+    eq_(select.value_options, ['first', 'second', 'third', 'Fourth option'])
+
+
 def test_basic_checkbox_state():
     browser.open('/form/checkboxes')
     fields = browser.document['form'][0]['input[type=checkbox]']
@@ -420,6 +508,17 @@ def test_basic_radio_state():
     assert data == [['x', 'x4']]
 
 
+def test_fill_radio_groups():
+    browser.open('/form/radios')
+    form = browser.document.forms[0]
+    form.fill({'x': 'x2'})
+    eq_(form.form_values(), [('x', 'x2')])
+    form.fields['x'] = 'x1'
+    eq_(form.form_values(), [('x', 'x1')])
+    assert_raises(KeyError, form.fill, {'x': 'x9'})
+    eq_(form.form_values(), [('x', 'x1')])
+
+
 def _test_radio(form_num, field_num, value, expected_return):
 
     def _radio():
@@ -0,0 +1,54 @@
+# Copyright Action Without Borders, Inc., the Alfajor authors and contributors.
+# All rights reserved.  See AUTHORS.
+#
+# This file is part of 'alfajor' and is distributed under the BSD license.
+# See LICENSE for more details.
+import os
+import shutil
+import tempfile
+
+from nose.tools import eq_
+
+from alfajor.browsers._history import History
+from alfajor.browsers.wsgi import WSGI
+
+from .webapp import webapp
+
+
+def test_history_ring():
+    history = History(size=3, memory_budget=10)
+    for n in range(5):
+        history.record('GET', '/%s' % n, 200, {'X-N': str(n)}, 'body %s' % n)
+    eq_([entry.url for entry in history], ['/2', '/3', '/4'])
+    eq_([entry.spilled for entry in history], [True, True, False])
+    eq_([entry.body for entry in history], ['body 2', 'body 3', 'body 4'])
+    eq_(history[-1].headers, (('X-N', '4'),))
+    spilled = history[0]._path
+    assert os.path.exists(spilled)
+
+    history.record('GET', '/5', 200, (), u'caf\xe9')
+    assert not os.path.exists(spilled)
+    eq_(history[-1].body, 'caf\xc3\xa9')
+    history.clear()
+    eq_(len(history), 0)
+
+
+def test_browser_history():
+    browser = WSGI(webapp(), 'http://localhost')
+    browser.history = History(size=2)
+    browser.open('/')
+    browser.open('/seq/c')
+    eq_([(entry.url, entry.status_code) for entry in browser.history],
+        [('http://localhost/', 200), ('http://localhost/seq/d', 200)])
+    assert 'hi there' in browser.history[0].body
+    assert browser.history[0].duration >= 0
+
+    directory = tempfile.mkdtemp()
+    try:
+        paths = browser.history.dump(directory)
+        eq_([os.path.basename(p) for p in paths],
+            ['page-00.html', 'page-01.html'])
+        assert 'hi there' in open(paths[0]).read()
+        assert os.path.exists(os.path.join(directory, 'page-01.headers'))
+    finally:
+        shutil.rmtree(directory)
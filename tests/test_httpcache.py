@@ -0,0 +1,109 @@
+# Copyright Action Without Borders, Inc., the Alfajor authors and contributors.
+# All rights reserved.  See AUTHORS.
+#
+# This file is part of 'alfajor' and is distributed under the BSD license.
+# See LICENSE for more details.
+
+from nose.tools import eq_
+from werkzeug import Request, Response
+
+from alfajor.browsers._httpcache import HTTPCache, _max_age
+from alfajor.browsers.network import Network
+from alfajor.browsers.wsgi import WSGI
+
+from tests import serve
+
+
+class CachingApp(object):
+    """Serves /<cache-control>/<name> with an ETag, counting full bodies."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, environ, start_response):
+        request = Request(environ)
+        cache_control, name = request.path.strip('/').split('/')
+        etag = '"%s"' % name
+        self.calls.append((request.path,
+                           request.headers.get('If-None-Match')))
+        if request.headers.get('If-None-Match') == etag:
+            response = Response(status=304)
+        else:
+            response = Response('<html><body><p>%s %s</p></body></html>' %
+                                (name, len(self.calls)), mimetype='text/html')
+        response.headers['ETag'] = etag
+        if cache_control != 'none':
+            response.headers['Cache-Control'] = cache_control
+        if name == 'cookie':
+            response.set_cookie('c', '1')
+        return response(environ, start_response)
+
+
+def test_fresh_responses_skip_the_app():
+    app = CachingApp()
+    browser = WSGI(app, 'http://localhost')
+    browser.http_cache = HTTPCache([r'/max-age=60/'])
+    browser.open('/max-age=60/a')
+    browser.open('/max-age=60/a')
+    eq_(len(app.calls), 1)
+    eq_(browser.document['p'][0].text, 'a 1')
+    eq_(browser.status_code, 200)
+    eq_(browser.timing.counts['cache-hits'], 1)
+    eq_(browser.http_cache.hits, 1)
+
+
+def test_stale_responses_are_revalidated():
+    app = CachingApp()
+    browser = WSGI(app, 'http://localhost')
+    browser.http_cache = HTTPCache(['.'])
+    browser.open('/no-cache/a')
+    browser.open('/no-cache/a')
+    eq_(app.calls, [('/no-cache/a', None), ('/no-cache/a', '"a"')])
+    eq_(browser.status_code, 200)
+    eq_(browser.document['p'][0].text, 'a 1')
+    eq_(browser.http_cache.revalidations, 1)
+
+
+def test_uncacheable_responses():
+    app = CachingApp()
+    browser = WSGI(app, 'http://localhost')
+    browser.http_cache = HTTPCache([r'/max-age=60/a', '/no-store/',
+                                    '/max-age=60/cookie'])
+    for path in ('/max-age=60/b', '/no-store/a', '/max-age=60/cookie'):
+        browser.open(path)
+        browser.open(path)
+    eq_(len(app.calls), 6)
+    eq_(len(browser.http_cache), 0)
+
+
+def test_network_revalidation():
+    app = CachingApp()
+    server = serve(app)
+    try:
+        browser = Network('http://127.0.0.1:%s' % server.server_port)
+        browser.http_cache = HTTPCache(['.'])
+        browser.open('/no-cache/a')
+        browser.document['p'][0].text = 'changed'
+        browser.open('/no-cache/a')
+        eq_(app.calls, [('/no-cache/a', None), ('/no-cache/a', '"a"')])
+        eq_(browser.status_code, 200)
+        eq_(browser.document['p'][0].text, 'a 1')
+        eq_(browser.timing.counts['cache-revalidations'], 1)
+        first = browser.document
+        browser.open('/no-cache/a')
+        eq_(browser.document['p'][0].text, 'a 1')
+        assert browser.document is not first
+        browser.open('/max-age=60/b')
+        browser.open('/max-age=60/b')
+        eq_(len(app.calls), 4)
+        eq_(browser.timing.counts['cache-hits'], 1)
+    finally:
+        server.shutdown()
+
+
+def test_max_age():
+    eq_(_max_age([('Cache-Control', 'public, max-age=30')]), 30)
+    eq_(_max_age([('Cache-Control', 'max-age=30, no-cache')]), 0)
+    eq_(_max_age([('Date', 'Sun, 06 Nov 1994 08:49:37 GMT'),
+                  ('Expires', 'Sun, 06 Nov 1994 08:50:37 GMT')]), 60)
+    eq_(_max_age([]), 0)
@@ -4,9 +4,14 @@
 # This file is part of 'alfajor' and is distributed under the BSD license.
 # See LICENSE for more details.
 
+import multiprocessing
+import socket
+import sys
+
 from alfajor._management import _DeferredProxy
+from alfajor.browsers.managers import NetworkManager, _stop_server_pools
 
-from nose.tools import assert_raises
+from nose.tools import assert_raises, eq_
 
 
 def test_proxy_readiness():
@@ -20,3 +25,61 @@ def test_proxy_readiness():
     proxy = _DeferredProxy()
     proxy._factory = lambda: sentinel
     assert proxy.prop == 123
+
+
+pool_config = {
+    'cmd': '%s -m SimpleHTTPServer $port' % sys.executable,
+    'server_url': 'http://localhost:$port/',
+    'ping-address': 'localhost:$port',
+    'server-pool-size': '2',
+    }
+
+
+def test_server_pool_spans_managers():
+    first = NetworkManager('network', pool_config, {})
+    second = NetworkManager('network', pool_config, {})
+    try:
+        urls = [first.create()._base_url, second.create()._base_url]
+        assert first.pool is second.pool
+        eq_(sorted(urls), sorted(first.pool.urls))
+        first.destroy()
+        eq_(len(second.pool.servers), 2)
+        second.destroy()
+    finally:
+        _stop_server_pools()
+
+
+def _worker(queue):
+    manager = NetworkManager('network', pool_config, {})
+    url = manager.create()._base_url
+    queue.put((url, len(manager.pool.servers)))
+    manager.destroy()
+
+
+def _accepts_connections(url):
+    port = int(url.rstrip('/').rsplit(':', 1)[1])
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.connect(('localhost', port))
+    except socket.error:
+        return False
+    sock.close()
+    return True
+
+
+def test_server_pool_spans_workers():
+    queue = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_worker, args=(queue,))
+               for i in range(2)]
+    for worker in workers:
+        worker.start()
+    results = [queue.get(timeout=30) for worker in workers]
+    for worker in workers:
+        worker.join()
+    urls = [url for url, started in results]
+    # each worker boots and uses only its own server...
+    eq_([started for url, started in results], [1, 1])
+    eq_(len(set(urls)), 2)
+    # ...and stops it on the way out
+    for url in urls:
+        assert not _accepts_connections(url)
@@ -0,0 +1,208 @@
+# Copyright Action Without Borders, Inc., the Alfajor authors and contributors.
+# All rights reserved.  See AUTHORS.
+#
+# This file is part of 'alfajor' and is distributed under the BSD license.
+# See LICENSE for more details.
+
+import gzip
+import io
+import os
+from StringIO import StringIO
+import tempfile
+import urllib2
+import zlib
+
+from nose.tools import assert_raises, eq_
+from werkzeug import Request
+
+from alfajor.browsers.network import Network, after_browser_activity
+
+from tests import serve
+
+
+text = 'compressible ' * 500
+page = '<html><body><p>%s</p></body></html>' % text
+
+
+def gzipped(data):
+    buffer = StringIO()
+    fh = gzip.GzipFile(fileobj=buffer, mode='wb')
+    fh.write(data)
+    fh.close()
+    return buffer.getvalue()
+
+
+encoders = {
+    '/gzip': ('gzip', gzipped),
+    '/deflate': ('deflate', zlib.compress),
+    '/raw-deflate': ('deflate', lambda data: zlib.compress(data)[2:-4]),
+    }
+
+
+class EncodingApp(object):
+    """Serves :data:`page` compressed as the path says, if accepted."""
+
+    def __init__(self):
+        self.accepted = []
+
+    def __call__(self, environ, start_response):
+        accepted = environ.get('HTTP_ACCEPT_ENCODING', '')
+        self.accepted.append(accepted)
+        headers = [('Content-Type', 'text/html')]
+        body = page
+        if environ['PATH_INFO'] in encoders:
+            encoding, encode = encoders[environ['PATH_INFO']]
+            if encoding in accepted:
+                headers.append(('Content-Encoding', encoding))
+                body = encode(page)
+        headers.append(('Content-Length', str(len(body))))
+        start_response('200 OK', headers)
+        return [body]
+
+
+def test_compressed_responses():
+    app = EncodingApp()
+    server = serve(app)
+    try:
+        browser = Network('http://127.0.0.1:%s' % server.server_port)
+        for path in ('/gzip', '/deflate', '/raw-deflate'):
+            browser.open(path)
+            eq_(browser.response, page)
+            eq_(browser.headers['Content-Encoding'], encoders[path][0])
+            counts = browser.timing.counts
+            eq_(counts['body-bytes'], len(page))
+            assert counts['wire-bytes'] < len(page) / 10
+        browser.open('/identity')
+        eq_(browser.response, page)
+        eq_(browser.timing.counts['wire-bytes'], len(page))
+        eq_(app.accepted, ['gzip, deflate'] * 4)
+
+        browser.accept_encoding = False
+        browser.open('/gzip')
+        eq_(browser.response, page)
+        assert 'Content-Encoding' not in browser.headers
+        assert 'gzip' not in app.accepted[-1]
+    finally:
+        server.shutdown()
+
+
+def test_streaming_reads():
+    app = EncodingApp()
+    server = serve(app)
+    try:
+        browser = Network('http://127.0.0.1:%s' % server.server_port)
+        browser.incremental_parse = True
+        for path in ('/identity', '/gzip'):
+            browser.open(path)
+            eq_(browser.response, page)
+            assert 'document' in browser.__dict__
+            assert browser.timing.phases['parse'] > 0
+            eq_(browser.document['p'][0].text, text)
+
+        browser.max_body_size = len(page)
+        browser.open('/gzip')
+        browser.max_body_size = len(page) - 1
+        for path in ('/identity', '/gzip'):
+            assert_raises(AssertionError, browser.open, path)
+        # the shared parser survives an abandoned incremental parse
+        browser.max_body_size = None
+        browser.open('/gzip')
+        eq_(browser.document['p'][0].text, text)
+    finally:
+        server.shutdown()
+
+
+class Unseekable(object):
+    """A file-like body that can only be read."""
+
+    def __init__(self, data):
+        self.read = StringIO(data).read
+
+
+def echo_app(environ, start_response):
+    request = Request(environ)
+    files = [(name, file.filename, file.content_type, len(file.read()))
+             for name, file in sorted(request.files.items())]
+    body = repr((request.method, request.args.items(),
+                 request.form.items(), files,
+                 request.form and '' or request.data))
+    start_response('200 OK', [('Content-Type', 'text/plain'),
+                              ('Content-Length', str(len(body)))])
+    if request.method == 'HEAD':
+        return []
+    return [body]
+
+
+def test_methods_and_bodies():
+    fh, path = tempfile.mkstemp(suffix='.txt')
+    os.write(fh, 'x' * 200000)
+    os.close(fh)
+    server = serve(echo_app)
+    try:
+        browser = Network('http://127.0.0.1:%s' % server.server_port)
+        echoed = lambda: eval(browser.response)
+
+        browser.open('/', method='DELETE', data={'a': '1'})
+        eq_(echoed(), ('DELETE', [('a', '1')], [], [], ''))
+        browser.open('/', method='PATCH', data={'a': u'\N{SNOWMAN}'})
+        eq_(echoed(), ('PATCH', [], [], [], 'a=%E2%98%83'))
+        browser.open('/', method='PUT', data='{"a": 1}',
+                     content_type='application/json')
+        eq_(echoed(), ('PUT', [], [], [], '{"a": 1}'))
+        browser.open('/', method='PUT', data=open(path, 'rb'),
+                     content_type='application/octet-stream')
+        eq_(echoed()[-1], 'x' * 200000)
+        for stream in (io.BytesIO('in memory'), StringIO('in memory'),
+                       Unseekable('in memory')):
+            browser.open('/', method='PUT', data=stream,
+                         content_type='text/plain')
+            eq_(echoed()[-1], 'in memory')
+        assert_raises(ValueError, browser.open, '/', method='GET', data='x',
+                      content_type='text/plain')
+
+        browser.open('/', method='POST',
+                     data=[('a', '1'), ('f', (path, None))])
+        eq_(echoed(), ('POST', [], [('a', '1')],
+                       [('f', os.path.basename(path), 'text/plain',
+                         200000)], ''))
+        browser.open('/', method='POST', data=[('say "hi"', '1')],
+                     content_type='multipart/form-data')
+        eq_(echoed()[2], [('say "hi"', '1')])
+
+        browser.open('/', method='HEAD')
+        eq_(browser.status_code, 200)
+        eq_(browser.response, None)
+        eq_(browser.document, None)
+    finally:
+        server.shutdown()
+        os.remove(path)
+
+
+def failing_app(environ, start_response):
+    start_response('500 Internal Server Error', [('Content-Type',
+                                                  'text/plain')])
+    return ['broken']
+
+
+def test_failed_requests_are_timed():
+    timings = []
+
+    def collect(sender):
+        timings.append(sender.timing)
+    after_browser_activity.connect(collect)
+    server = serve(failing_app)
+    try:
+        browser = Network('http://127.0.0.1:%s' % server.server_port)
+        assert_raises(urllib2.HTTPError, browser.open, '/')
+        server.shutdown()
+        server.server_close()
+        assert_raises(urllib2.URLError, browser.open, '/')
+    finally:
+        after_browser_activity.disconnect(collect)
+        server.shutdown()
+    eq_(len(timings), 2)
+    for timing in timings:
+        assert timing.finished
+        eq_(timing.counts['errors'], 1)
+    eq_(browser.stats.operations['open'][0], 2)
+    eq_(browser.stats.counts['errors'], 2)
@@ -0,0 +1,125 @@
+# Copyright Action Without Borders, Inc., the Alfajor authors and contributors.
+# All rights reserved.  See AUTHORS.
+#
+# This file is part of 'alfajor' and is distributed under the BSD license.
+# See LICENSE for more details.
+
+from optparse import OptionParser
+import os
+from os import path
+import shutil
+from StringIO import StringIO
+import tempfile
+
+from nose.config import Config
+from nose.tools import eq_
+
+from alfajor.browsers._history import History
+from alfajor.browsers._timing import BrowserStats, Timing
+from alfajor._management import Declaration, _DeferredProxy
+from alfajor.runners.nose import Alfajor, _Profile
+
+
+class StubBrowser(object):
+
+    def __init__(self):
+        self.stats = BrowserStats()
+
+    def open(self):
+        timing = Timing('open', '/')
+        timing.add('parse', 0.25)
+        timing.finish()
+        self.stats.record(timing)
+
+
+class StubManager(object):
+
+    process = None
+
+    def create(self):
+        return StubBrowser()
+
+    def destroy(self):
+        pass
+
+
+class context(object):
+    pass
+
+
+def test_profile():
+    profile = _Profile()
+    manager = StubManager()
+    browser = profile.timed_create(context, manager)()
+    browser.open()
+
+    profile.start_test([browser])
+    browser.open()
+    browser.open()
+    profile.stop_test('test_a', context, [browser])
+    profile.timed_destroy(context, manager)
+
+    test = profile.tests['test_a']
+    assert test['open'][0] == 2
+    assert test['parse'] == [2, 0.5]
+    assert test['test'][0] == 1
+    totals = profile.contexts['context']
+    assert totals['create'][0] == totals['destroy'][0] == 1
+    assert totals['parse'] == [2, 0.5]
+    assert 'test_a' in profile.as_text()
+    assert profile.as_dict()['tests'] is profile.tests
+
+
+def test_profile_report_files():
+    directory = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        for args, written in (([], []), (['--alfajor-profile-file',
+                                          'profile.json'], ['profile.json'])):
+            parser = OptionParser()
+            plugin = Alfajor()
+            plugin.options(parser, {})
+            options, _ = parser.parse_args(['--alfajor-profile'] + args)
+            plugin.configure(options, Config())
+            stream = StringIO()
+            plugin.report(stream)
+            assert 'Alfajor profile' in stream.getvalue()
+            eq_(os.listdir(directory), written)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory)
+
+
+class StubTest(object):
+
+    def id(self):
+        return 'tests.test_nose.test_failing'
+
+
+def test_history_per_browser():
+    directory = tempfile.mkdtemp()
+    try:
+        plugin = Alfajor()
+        plugin.options = {'history_dir': directory}
+        managers = set()
+        for configuration, url in (('default', '/a'), ('default', '/b'),
+                                   ('admin', '/c')):
+            browser = StubBrowser()
+            browser.history = History()
+            browser.history.record('GET', url, 200, (), url)
+            proxy = _DeferredProxy()
+            proxy._instance = browser
+            declaration = Declaration(proxy, configuration, None, None,
+                                      'browser', None)
+            managers.add((StubManager(), declaration))
+        plugin._contexts.append((context, managers))
+        plugin.historyIfEnabled(StubTest())
+
+        written = path.join(directory, 'test_failing')
+        eq_(sorted(os.listdir(written)), ['admin', 'default', 'default-2'])
+        bodies = sorted(open(path.join(written, name, 'page-00.html')).read()
+                        for name in os.listdir(written))
+        eq_(bodies, ['/a', '/b', '/c'])
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,116 @@
+# Copyright Action Without Borders, Inc., the Alfajor authors and contributors.
+# All rights reserved.  See AUTHORS.
+#
+# This file is part of 'alfajor' and is distributed under the BSD license.
+# See LICENSE for more details.
+import os
+import shutil
+import tempfile
+
+from nose.tools import eq_
+
+from alfajor.apiclient import APIClient, WSGIClientManager
+from alfajor.browsers.managers import ReplayManager, WSGIManager
+from alfajor.browsers.network import Network
+from alfajor.browsers.wsgi import WSGI
+from alfajor.recording import Archive, ArchiveApp, Recorder, request_key
+
+from tests import serve
+from tests.browser.webapp import webapp
+
+
+def test_request_key():
+    eq_(request_key('get', 'http://localhost:8008/a?b=1'), 'GET /a?b=1')
+    eq_(request_key('GET', 'http://example.com'), 'GET /')
+    form = 'application/x-www-form-urlencoded'
+    eq_(request_key('POST', '/a', form, 'x=1&y=2'),
+        request_key('POST', '/a', form, 'y=2&x=1'))
+    assert (request_key('POST', '/a', form, 'x=1') !=
+            request_key('POST', '/a', form, 'x=2'))
+    eq_(request_key('POST', '/a', 'multipart/form-data; boundary=1', 'x'),
+        'POST /a')
+
+
+def test_record_and_replay():
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'archive')
+    try:
+        recorder = Recorder(path)
+        browser = WSGI(webapp(), 'http://localhost:8008')
+        browser.recorder = recorder
+        browser.open('/')
+        browser.open('/seq/c')
+        browser.open('/form/fill')
+        browser.document.forms[1].fill({'xx_a': 'recorded'})
+        browser.document.forms[1].submit()
+        submitted = browser.document['#data'].text
+        client = APIClient(webapp(), recorder=recorder)
+        client.get('/seq/a').client.get('/seq/b')
+        recorder.close()
+
+        archive = Archive(path)
+        eq_(len(archive), 7)
+        replay = WSGI(ArchiveApp(archive), 'http://replayed')
+        replay.open('/')
+        assert 'hi there' in replay
+        replay.open('/seq/c')
+        assert replay.location == 'http://replayed/seq/d'
+        replay.open('/form/fill')
+        replay.document.forms[1].fill({'xx_a': 'recorded'})
+        replay.document.forms[1].submit()
+        eq_(replay.document['#data'].text, submitted)
+        replay.open('/never-recorded')
+        eq_(replay.status_code, 404)
+        archive.close()
+
+        manager = ReplayManager('replay', {'archive': path,
+                                           'base_url': 'http://replayed'},
+                                {})
+        replay = manager.create()
+        replay.open('/seq/a')
+        eq_(replay.status_code, 200)
+        manager.destroy()
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_record_head_requests():
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'archive')
+    server = serve(webapp())
+    try:
+        recorder = Recorder(path)
+        browser = Network('http://127.0.0.1:%s' % server.server_port)
+        browser.recorder = recorder
+        browser.open('/', method='HEAD')
+        eq_(browser.response, None)
+        recorder.close()
+
+        archive = Archive(path)
+        status, headers, body, url = archive.lookup('HEAD', '/')
+        eq_(status, '200 OK')
+        eq_(body, '')
+        archive.close()
+    finally:
+        server.shutdown()
+        shutil.rmtree(directory)
+
+
+def test_managers_close_recorders():
+    directory = tempfile.mkdtemp()
+    try:
+        config = {'server-entry-point': 'tests.browser.webapp:webapp()',
+                  'base_url': 'http://localhost',
+                  'record': os.path.join(directory, 'archive')}
+        for manager in (WSGIManager('wsgi', config, {}),
+                        WSGIClientManager('apiclient', config, {})):
+            client = manager.create()
+            recorder = client.recorder
+            client.open('/')
+            assert not recorder._data.closed
+            manager.destroy()
+            assert recorder._data.closed
+            assert recorder._index.closed
+            assert client.recorder is None
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,101 @@
+# Copyright Action Without Borders, Inc., the Alfajor authors and contributors.
+# All rights reserved.  See AUTHORS.
+#
+# This file is part of 'alfajor' and is distributed under the BSD license.
+# See LICENSE for more details.
+
+from nose.tools import eq_
+
+from alfajor.browsers.selenium import Selenium, SeleniumRemote
+
+
+class StubRemote(SeleniumRemote):
+    """Records RC commands instead of sending them to a server."""
+
+    def __init__(self, responses=None):
+        SeleniumRemote.__init__(self, 'http://localhost:4444', '*stub',
+                                16000)
+        self.responses = responses or {}
+        self.commands = []
+
+    def __call__(self, command, *args, **kw):
+        self.commands.append((command,) + args)
+        response = self.responses.get(command)
+        if callable(response):
+            return response(*args)
+        return response
+
+
+def stub_browser(**responses):
+    browser = Selenium('http://localhost:4444', '*stub')
+    browser.selenium = remote = StubRemote(responses)
+    remote._session_id = 'session'
+    remote._current_timeout = 16000
+    return browser, remote
+
+
+def test_waits_are_single_round_trips():
+    browser, remote = stub_browser()
+    browser.wait_for('element:id=a', 5000)
+    browser.wait_for('!element:id=a', 5000)
+    browser.wait_for('ajax', 5000)
+    browser.wait_for('js:window.ready', 5000)
+    browser.wait_for('element:id=b')
+    eq_([command for command in remote.commands],
+        [('waitForCondition', "selenium.isElementPresent('id=a')", 5000),
+         ('waitForCondition', "!selenium.isElementPresent('id=a')", 5000),
+         ('waitForCondition', 'selenium.browserbot.getCurrentWindow()'
+          '.jQuery.active == 0;', 5000),
+         ('waitForCondition', 'var window = '
+          'selenium.browserbot.getCurrentWindow(); window.ready', 5000),
+         ('waitForCondition', "selenium.isElementPresent('id=b')", 16000)])
+    eq_(remote._current_timeout, 16000)
+
+
+def test_predicates_are_registered_once_per_session():
+    browser, remote = stub_browser()
+    first = browser.wait_expression().element_present('#a')
+    second = browser.wait_expression().element_present('#b')
+    for expression in first, second, first, second:
+        browser.wait_for(expression, 5000)
+    evals = [command for command in remote.commands
+             if command[0] == 'getEval']
+    eq_(len(evals), 2)
+    assert "predicates[0]" in evals[0][1]
+    assert "findElement('css=#a')" in evals[0][1]
+    assert "predicates[1]" in evals[1][1]
+    waits = [command for command in remote.commands
+             if command[0] == 'waitForCondition']
+    eq_([js for command, js, timeout in waits],
+        ['var window = selenium.browserbot.getCurrentWindow(); '
+         'selenium.alfajorPredicates[%s]()' % n for n in (0, 1, 0, 1)])
+
+    # a new session starts with no predicates installed
+    remote.test_complete()
+    eq_(remote._predicates, {})
+    browser.wait_for(first, 5000)
+    remote.get_new_browser_session('http://localhost/')
+    eq_(remote._predicates, {})
+    del remote.commands[:]
+    browser.wait_for(second, 5000)
+    eq_([command[0] for command in remote.commands],
+        ['getEval', 'waitForCondition'])
+    assert "predicates[0]" in remote.commands[0][1]
+
+
+def test_visible_is_one_script():
+    browser, remote = stub_browser(
+        getHtmlSource='<body><p id="a">x</p><div><p>y</p></div></body>',
+        getEval='true,false')
+    browser.sync_document()
+    ps = browser.document['p']
+    del remote.commands[:]
+    eq_(browser.visible(ps), [True, False])
+    eq_(len(remote.commands), 1)
+    command, js = remote.commands[0]
+    eq_(command, 'getEval')
+    assert '\n' not in js
+    assert "var locators = ['id=a', 'xpath=/html/body/div/p'];" in js
+    assert 'selenium.isVisible(locators[i])' in js
+    eq_(browser.visible([]), [])
+    eq_(len(remote.commands), 1)
@@ -0,0 +1,63 @@
+# Copyright Action Without Borders, Inc., the Alfajor authors and contributors.
+# All rights reserved.  See AUTHORS.
+#
+# This file is part of 'alfajor' and is distributed under the BSD license.
+# See LICENSE for more details.
+
+import os
+import shutil
+import sys
+import tempfile
+from urllib2 import urlopen
+
+from alfajor.apiclient import APIClient
+from alfajor.utilities import RequestProfiler, ServerPool
+
+from nose.tools import assert_raises, eq_
+
+
+def test_server_pool():
+    cmd = [sys.executable, '-m', 'SimpleHTTPServer', '$port']
+    pool = ServerPool(cmd, 'http://localhost:$port/', 2, 'localhost:$port')
+    assert_raises(RuntimeError, pool.next_url)
+
+    pool.start()
+    try:
+        urls = pool.urls
+        eq_(len(set(urls)), 2)
+        eq_([pool.next_url() for i in range(3)], [urls[0], urls[1], urls[0]])
+        eq_(pool.url_for(3), urls[1])
+        eq_(pool.url_for(3), pool.url_for(3))
+        for url in urls:
+            assert urlopen(url).getcode() == 200
+        for url, process in pool.servers:
+            assert process.startup_time > 0
+    finally:
+        pool.stop()
+    assert not pool.urls
+
+
+def test_request_profiler():
+    def app(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return ['ok']
+
+    directory = tempfile.mkdtemp()
+    try:
+        profiler = RequestProfiler(directory, pattern='/slow')
+        profiler.label = 'tests.test_a'
+        client = APIClient(app, profiler=profiler)
+        eq_(client.get('/fast').response, 'ok')
+        eq_(profiler.written, [])
+        response = client.get('/slow?x=1')
+        eq_(response.response, 'ok')
+        response.client.get('/slow')
+        eq_([os.path.basename(name) for name in profiler.written],
+            ['tests.test_a.http_localhost_slow_x_1.pstats',
+             'tests.test_a.http_localhost_slow.pstats'])
+
+        profiler.rate = 0.0
+        client.get('/slow')
+        eq_(len(profiler.written), 2)
+    finally:
+        shutil.rmtree(directory)
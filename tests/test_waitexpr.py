@@ -0,0 +1,96 @@
+# Copyright Action Without Borders, Inc., the Alfajor authors and contributors.
+# All rights reserved.  See AUTHORS.
+#
+# This file is part of 'alfajor' and is distributed under the BSD license.
+# See LICENSE for more details.
+
+from lxml.html import fromstring
+from nose.tools import assert_raises
+
+from alfajor.browsers._waitexpr import (
+    LxmlWaitExpression,
+    SeleniumWaitExpression,
+    lxml_predicate,
+    )
+
+
+def test_selenium_rendering():
+    expr = (SeleniumWaitExpression().
+            element_present('#druid').
+            or_().
+            ajax_complete())
+    js = unicode(expr)
+    assert '\n' not in js
+    assert "findElement('css=#druid')" in js
+    assert ' || ' in js
+    assert unicode(expr) is js
+
+    expr.element_not_present('#druid')
+    assert unicode(expr) is not js
+    assert unicode(expr).startswith(js + u' && ')
+
+
+def test_selenium_component_cache():
+    first = SeleniumWaitExpression(['element_present', '#druid'],
+                                   ['evaluate_element', '#x', 'true'])
+    second = SeleniumWaitExpression(['element_present', '#druid'],
+                                    ['evaluate_element', '#x', 'true'])
+    assert first._expressions[0] is second._expressions[0]
+    assert first._expressions[1] is second._expressions[1]
+    assert unicode(first) == unicode(second)
+
+
+def test_lxml_evaluation():
+    document = fromstring('<html><body><p id="a">x</p>'
+                          '<p name="b">y</p></body></html>')
+    calls = []
+
+    def spy(element):
+        calls.append(element.text)
+        return True
+
+    expr = LxmlWaitExpression(['element_present', '#missing'],
+                              ['evaluate_element', 'p', spy])
+    assert not expr.evaluate(document)
+    assert calls == []
+
+    expr.or_().element_not_present('div').evaluate_element('p', spy)
+    predicate = expr.compile()
+    assert predicate(document)
+    assert calls == ['x']
+    assert expr.compile() is predicate
+    expr.ajax_pending()
+    assert expr.compile() is not predicate
+    assert not expr.evaluate(document)
+    assert not expr.evaluate(None)
+
+
+def test_lxml_locators():
+    document = fromstring('<html><body><p id="a">x</p>'
+                          '<p name="b">y</p></body></html>')
+    for locator in ('css=p#a', 'xpath=//p[2]', '//p', 'id=a', 'name=b',
+                    'identifier=a', 'b'):
+        assert lxml_predicate('element:' + locator)(document), locator
+        assert not lxml_predicate('!element:' + locator)(document), locator
+    assert not lxml_predicate('element:id=b')(document)
+    assert lxml_predicate('js:true') is None
+    assert lxml_predicate('page') is None
+
+
+def test_lxml_link_locators():
+    document = fromstring('<html><body><a href="/">Foo\n <b>Bar</b></a>'
+                          '<a>Baz</a></body></html>')
+    for locator in ('link=Foo Bar', 'link=Foo*', 'link=glob:?az',
+                    'link=exact:Foo Bar', 'link=regexp:o B',
+                    'link=regexpi:^baz$'):
+        assert lxml_predicate('element:' + locator)(document), locator
+    for locator in ('link=Foo', 'link=exact:Foo*', 'link=regexp:^baz'):
+        assert not lxml_predicate('element:' + locator)(document), locator
+        assert lxml_predicate('!element:' + locator)(document), locator
+    assert not lxml_predicate('element:link=Foo*')(None)
+
+
+def test_lxml_unsupported_locators():
+    for locator in ('dom=document.links[0]', 'document.links[0]',
+                    'ui=page::link()', 'bogus=x'):
+        assert_raises(ValueError, lxml_predicate, 'element:' + locator)